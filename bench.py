@@ -0,0 +1,462 @@
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from scripts.board import Board, ATTACKER, DEFENDER, KING_KIND, zobrist_hash
+from scripts.bitboard import BitBoard
+from scripts.bot import Bot
+from scripts.evaluation import MATE_SCORE
+from scripts.batch_eval import child_arrays, evaluate_batch
+from scripts.move import Move
+
+INF = float('inf')
+
+# Known-good perft counts, one per depth starting at 1. Any change to the move
+# generation or the capture rules that changes these numbers is a rules change.
+STARTING_PERFT = {
+    9: [72, 3944, 285728],
+    11: [116, 6788, 806344],
+}
+
+# Moves of two recorded games, the midgame positions are taken along them
+GAMES = {
+    9: [
+        (1, 4, 1, 8), (4, 6, 1, 6), (0, 5, 1, 5), (2, 4, 2, 7), (1, 5, 1, 4), (6, 4, 6, 8), (8, 3, 6, 3), (4, 2, 2, 2),
+        (6, 3, 5, 3), (2, 7, 2, 3), (1, 8, 1, 7), (3, 4, 3, 6), (0, 4, 0, 5), (6, 8, 6, 6), (5, 0, 5, 2), (4, 4, 2, 4),
+        (8, 5, 6, 5), (1, 6, 0, 6), (5, 3, 6, 3), (3, 6, 1, 6), (8, 4, 8, 6), (2, 4, 2, 5), (6, 5, 5, 5), (2, 2, 0, 2),
+        (4, 1, 3, 1), (0, 2, 1, 2), (0, 3, 0, 4), (1, 2, 0, 2), (7, 4, 7, 7), (5, 4, 6, 4), (0, 5, 1, 5), (2, 5, 3, 5),
+        (8, 6, 8, 4), (2, 3, 0, 3), (5, 5, 5, 3), (0, 2, 1, 2), (7, 7, 7, 2), (1, 2, 1, 1), (5, 8, 5, 7), (4, 5, 7, 5),
+    ],
+    11: [
+        (1, 5, 1, 4), (5, 3, 3, 3), (6, 10, 6, 8), (7, 5, 7, 8), (7, 10, 7, 9), (6, 6, 7, 6), (7, 9, 6, 9), (6, 5, 6, 6),
+        (0, 7, 1, 7), (7, 6, 7, 7), (7, 0, 7, 3), (5, 7, 3, 7), (1, 4, 1, 1), (6, 6, 9, 6), (1, 1, 1, 5), (9, 6, 9, 8),
+        (10, 3, 10, 2), (7, 7, 4, 7), (7, 3, 10, 3), (7, 8, 7, 9), (10, 2, 3, 2), (3, 3, 4, 3), (5, 1, 8, 1), (3, 7, 3, 6),
+        (6, 8, 6, 5), (7, 9, 7, 5), (3, 10, 1, 10), (4, 4, 3, 4), (5, 9, 5, 7), (3, 4, 2, 4), (5, 0, 5, 2), (9, 8, 1, 8),
+        (5, 10, 6, 10), (5, 4, 5, 3), (10, 7, 10, 8), (5, 3, 5, 4), (8, 1, 5, 1), (6, 4, 6, 3), (5, 7, 10, 7), (7, 5, 7, 8),
+    ],
+}
+
+# Midgame positions: board size and number of moves played from the starting position
+MIDGAME_POSITIONS = {
+    "9x9-opening": (9, 12),
+    "9x9-middlegame": (9, 24),
+    "9x9-late": (9, 40),
+    "11x11-opening": (11, 12),
+    "11x11-middlegame": (11, 24),
+    "11x11-late": (11, 40),
+}
+
+MIDGAME_PERFT = {
+    "9x9-opening": [72, 4049, 299915],
+    "9x9-middlegame": [97, 4063, 385281],
+    "9x9-late": [77, 4339, 347867],
+    "11x11-opening": [120, 7427, 906857],
+    "11x11-middlegame": [135, 9465, 1273245],
+    "11x11-late": [120, 10854, 1333134],
+}
+
+# Bot settings compared by --selectivity
+SELECTIVE_VARIANTS = {
+    "all": {},
+    "no-null-move": {"null_move_pruning": False},
+    "no-lmr": {"late_move_reductions": False},
+    "no-futility": {"futility_pruning": False},
+    "none": {"null_move_pruning": False, "late_move_reductions": False, "futility_pruning": False},
+}
+
+CHECK_DEPTH = 2     # Depth of the make_move / unmake_move round trip of --check
+CHECK_ERRORS = 10   # Mismatches printed by --check
+CHECK_BATCH_GAMES = 40      # Random games per board size along which --check compares evaluate_batch with Bot.evaluate
+CHECK_BATCH_PLIES = 80      # Longest of these games
+CLOCK_GAME_PLIES = 40     # Length of the games of --clock, the bot plays both sides
+
+BOARD_CLASSES = {
+    "bitboard": BitBoard,
+    "board": Board,
+}
+
+def perft(board: Board | BitBoard, depth: int) -> int:
+    '''
+    Count the leaf nodes of the game tree. Finished games count as leaves.
+
+    Parameters:
+        board (Board | BitBoard): The position to count from, left unchanged.
+        depth (int): The number of plies to look ahead.
+
+    Returns:
+        int: The number of leaf nodes.
+    '''
+    if depth == 0 or board.winner is not None:
+        return 1
+
+    nodes = 0
+    for move in list(board.generate_moves()):
+        board.move_piece_by_move(move)
+        nodes += perft(board, depth - 1)
+        board.undo_move()
+    return nodes
+
+def setup_board(board: Board | BitBoard, moves: list[tuple[int, int, int, int]]) -> Board | BitBoard:
+    for move in moves:
+        if not board.move_piece_by_move(Move(*move, board.width)):
+            raise ValueError(f"Illegal move in a stored position: {move}")
+    return board
+
+def run_perft(board_name: str, max_depth: int, log=sys.stdout) -> list[dict]:
+    board_class = BOARD_CLASSES[board_name]
+    positions = [(f"{size}x{size}-start", size, [], STARTING_PERFT[size]) for size in STARTING_PERFT]
+    positions += [(name, size, GAMES[size][:plies], MIDGAME_PERFT[name]) for name, (size, plies) in MIDGAME_POSITIONS.items()]
+
+    results = []
+    for name, size, moves, expected in positions:
+        board = setup_board(board_class(size, size), moves)
+        for depth, expected_nodes in enumerate(expected[:max_depth], start=1):
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            result = {
+                "position": name,
+                "board": board_name,
+                "depth": depth,
+                "nodes": nodes,
+                "expected": expected_nodes,
+                "ok": nodes == expected_nodes,
+                "time": elapsed,
+                "nps": nodes / elapsed if elapsed else 0.0,
+            }
+            results.append(result)
+            print(f"perft {board_name:8} {name:18} depth {depth}: {nodes:>9} nodes {'ok' if result['ok'] else f'EXPECTED {expected_nodes}'}  {elapsed:7.2f}s  {result['nps']:>9.0f} nodes/s", file=log)
+    return results
+
+def board_state(board: BitBoard) -> tuple:
+    '''
+    Everything make_move changes and unmake_move must restore.
+    '''
+    return (board.attackers, board.defenders, board.king, board.turn, board.winner, board.hash,
+            board.piece_score, board.ply, board.reversible_moves, tuple(board.hash_stack))
+
+def full_piece_score(board: BitBoard) -> int:
+    '''
+    The piece_score of the board computed from scratch.
+    '''
+    score = 0
+    for kind, mask in ((ATTACKER, board.attackers), (DEFENDER, board.defenders), (KING_KIND, board.king)):
+        table = board.piece_square_tables[kind]
+        while mask:
+            low = mask & -mask
+            score += table[low.bit_length() - 1]
+            mask ^= low
+    return score
+
+def round_trip(board: BitBoard, depth: int, errors: list[str], path: list[int]) -> int:
+    '''
+    Play the game tree with make_move and unmake_move like the search does. After every move
+    the incremental hash and piece_score must match their values computed from scratch, and
+    after every unmake_move or undo_null_move the board must be back to where it was.
+
+    Parameters:
+        board (BitBoard): The position to start from, left unchanged.
+        depth (int): The number of plies to look ahead.
+        errors (list[str]): Gets a description of every mismatch.
+        path (list[int]): The packed moves leading to the board from the starting position of the check.
+
+    Returns:
+        int: The number of leaf nodes, which must match perft.
+    '''
+    if depth == 0 or board.winner is not None:
+        return 1
+
+    before = board_state(board)
+    nodes = 0
+    for move in board.packed_moves():
+        path.append(move)
+        board.make_move(move)
+        if board.hash != zobrist_hash(board):
+            errors.append(f"hash after make_move {path}")
+        if board.piece_score != full_piece_score(board):
+            errors.append(f"piece_score after make_move {path}")
+        nodes += round_trip(board, depth - 1, errors, path)
+        board.unmake_move()
+        if board_state(board) != before:
+            errors.append(f"board after unmake_move {path}")
+        path.pop()
+
+    board.make_null_move()
+    if board.hash != zobrist_hash(board):
+        errors.append(f"hash after make_null_move {path}")
+    board.undo_null_move()
+    if board_state(board) != before:
+        errors.append(f"board after undo_null_move {path}")
+    return nodes
+
+def run_check(log=sys.stdout) -> list[dict]:
+    '''
+    Check the search version of the move generation on every stored position: the round trip
+    of round_trip, and its leaf count against the known perft count.
+    '''
+    positions = [(f"{size}x{size}-start", size, [], STARTING_PERFT[size]) for size in STARTING_PERFT]
+    positions += [(name, size, GAMES[size][:plies], MIDGAME_PERFT[name]) for name, (size, plies) in MIDGAME_POSITIONS.items()]
+
+    results = []
+    for name, size, moves, expected in positions:
+        board = setup_board(BitBoard(size, size), moves)
+        errors = []
+        nodes = round_trip(board, CHECK_DEPTH, errors, [])
+        result = {
+            "position": name,
+            "depth": CHECK_DEPTH,
+            "nodes": nodes,
+            "expected": expected[CHECK_DEPTH - 1],
+            "errors": errors,
+            "ok": nodes == expected[CHECK_DEPTH - 1] and not errors,
+        }
+        results.append(result)
+        count = 'ok' if nodes == result['expected'] else f"EXPECTED {result['expected']}"
+        print(f"check  {name:18} depth {CHECK_DEPTH}: {nodes:>9} nodes {count}  {len(errors)} round trip errors", file=log)
+        for error in errors[:CHECK_ERRORS]:
+            print(f"  {error}", file=log)
+    return results
+
+def run_batch_check(log=sys.stdout) -> list[dict]:
+    '''
+    Check that evaluate_batch scores every child of random positions like Bot.evaluate
+    scores it after make_move, and scores the children that end the game as mates.
+    '''
+    rng = random.Random(0)
+    results = []
+    for size in STARTING_PERFT:
+        bot = Bot(size, 0)
+        board = bot.board
+        errors = []
+        children = 0
+        for _ in range(CHECK_BATCH_GAMES):
+            board.reset(size, size)
+            for _ in range(rng.randrange(CHECK_BATCH_PLIES)):
+                if board.winner is not None:
+                    break
+                board.make_move(rng.choice(board.packed_moves()))
+            if board.winner is not None:
+                continue
+
+            moves = board.packed_moves()
+            scores = evaluate_batch(child_arrays(board, moves), board.turn)
+            for move, score in zip(moves, scores):
+                board.make_move(move)
+                if board.winner is None:
+                    expected = -bot.evaluate()      # For the side to move in the child, the opponent of the batch
+                elif not board.king or board.king & board.geometry.corner_mask:
+                    expected = MATE_SCORE
+                else:
+                    expected = None     # The opponent has no move left, which evaluate_batch does not look for
+                if expected is not None and score != expected:
+                    errors.append(f"evaluate_batch {score}, expected {expected} after move {move} of position {board.hash_stack[-1]:016x}")
+                children += 1
+                board.unmake_move()
+        bot.close()
+
+        result = {
+            "position": f"{size}x{size}-batch-eval",
+            "nodes": children,
+            "errors": errors,
+            "ok": not errors,
+        }
+        results.append(result)
+        print(f"check  {result['position']:18}         {children:>9} children  {len(errors)} evaluation errors", file=log)
+        for error in errors[:CHECK_ERRORS]:
+            print(f"  {error}", file=log)
+    return results
+
+def run_search(depth: int, log=sys.stdout, settings: dict = None) -> list[dict]:
+    results = []
+    for name, (size, plies) in MIDGAME_POSITIONS.items():
+        bot = Bot(size, 0)
+        setup_board(bot.board, GAMES[size][:plies])
+        bot.color = bot.board.turn
+        bot.max_depth = depth
+        bot.max_time = INF
+        bot.use_opening_book = False
+        bot.use_tablebase = False
+        for attribute, value in (settings or {}).items():
+            setattr(bot, attribute, value)
+
+        time_to_depth = []
+        def record_iteration(cur_depth: int, eval: int, move: Move):
+            time_to_depth.append(time.perf_counter() - start)
+        bot.iteration_callback = record_iteration
+
+        start = time.perf_counter()
+        move = bot.get_move()
+        elapsed = time.perf_counter() - start
+
+        result = {
+            "position": name,
+            "depth": depth,
+            "move": str(move),
+            "nodes": bot.numpos,
+            "time": elapsed,
+            "nps": bot.numpos / elapsed if elapsed else 0.0,
+            "time_to_depth": time_to_depth,
+            "tt_hit_rate": bot.transposition_table.hit_rate(),
+            "first_move_cutoff_rate": bot.move_orderer.first_move_cutoff_rate(),
+        }
+        results.append(result)
+        print(f"search {name:18} depth {depth}: {move}  {bot.numpos:>9} nodes  {elapsed:7.2f}s  {result['nps']:>7.0f} nodes/s  TT hit rate {result['tt_hit_rate']:.2f}", file=log)
+        bot.close()
+    return results
+
+def run_clock(clock: float, increment: float, log=sys.stdout) -> list[dict]:
+    '''
+    Play a game of the bot against itself on every board size, each side with its own game
+    clock, and report how the time manager shares the clock out over the moves.
+    '''
+    results = []
+    for size in GAMES:
+        bots = {}
+        for color in (0, 1):
+            bot = Bot(size, color)
+            bot.use_opening_book = False
+            bot.use_tablebase = False
+            bot.clock = clock
+            bot.increment = increment
+            bots[color] = bot
+
+        board = bots[0].board
+        move_times = {0: [], 1: []}
+        flagged = None      # Color of the side whose clock ran out
+        while board.winner is None and len(board.list_of_moves) < CLOCK_GAME_PLIES:
+            bot = bots[board.turn]
+            start = time.monotonic()
+            move = bot.get_move(start)
+            elapsed = time.monotonic() - start
+            if elapsed > bot.clock:
+                flagged = bot.color
+            bot.use_time(elapsed)
+            move_times[bot.color].append(elapsed)
+            for color in (0, 1):
+                bots[color].board.move_piece_by_move(move)
+            if flagged is not None:
+                break
+
+        for color, bot in bots.items():
+            times = move_times[color]
+            result = {
+                "size": size,
+                "color": color,
+                "clock": clock,
+                "increment": increment,
+                "moves": len(times),
+                "mean_move_time": sum(times) / len(times) if times else 0.0,
+                "max_move_time": max(times, default=0.0),
+                "clock_left": bot.clock,
+                "flagged": flagged == color,
+            }
+            results.append(result)
+            print(f"clock  {size}x{size} color {color}: {len(times):>3} moves  mean {result['mean_move_time']:6.2f}s  max {result['max_move_time']:6.2f}s  "
+                  f"{bot.clock:7.2f}s left{'  OUT OF TIME' if result['flagged'] else ''}", file=log)
+            bot.close()
+    return results
+
+def run_memory(games: int, log=sys.stdout) -> list[dict]:
+    '''
+    Measure what the server keeps for every hosted game: a table with its board after
+    the moves of a stored game, including the move list.
+    '''
+    from server import Table
+
+    results = []
+    for size, moves in GAMES.items():
+        gc.collect()
+        objects_before = len(gc.get_objects())
+        tracemalloc.start()
+        tables = [Table(board_id, setup_board(Board(size, size), moves)) for board_id in range(games)]
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        gc.collect()
+        objects = len(gc.get_objects()) - objects_before
+
+        result = {
+            "size": size,
+            "games": games,
+            "moves": len(moves),
+            "bytes_per_game": allocated / games,
+            "gc_objects_per_game": objects / games,
+        }
+        results.append(result)
+        print(f"memory {size}x{size} game after {len(moves)} moves: {result['bytes_per_game']:>9.0f} bytes  {result['gc_objects_per_game']:>6.1f} gc objects", file=log)
+        del tables
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Perft and search benchmarks for the engine.")
+    parser.add_argument("--perft-depth", type=int, default=3, help="maximum perft depth (default: 3)")
+    parser.add_argument("--search-depth", type=int, default=4, help="fixed search depth of the bot (default: 4)")
+    parser.add_argument("--board", choices=["bitboard", "board", "both"], default="bitboard", help="board implementation to run perft on")
+    parser.add_argument("--check", action="store_true", help="only check the move generation against the known perft counts and the make_move / unmake_move round trip, exit 1 on a mismatch")
+    parser.add_argument("--no-perft", action="store_true", help="skip the perft benchmark")
+    parser.add_argument("--no-search", action="store_true", help="skip the search benchmark")
+    parser.add_argument("--clock", type=float, metavar="SECONDS", help="play a game of the bot against itself on every board size with SECONDS on each clock")
+    parser.add_argument("--increment", type=float, default=0, help="seconds added to the clocks of --clock after every move (default: 0)")
+    parser.add_argument("--memory", type=int, metavar="GAMES", default=0, help="measure the server memory per hosted game over GAMES games")
+    parser.add_argument("--selectivity", action="store_true", help="compare the search with each selective search feature switched off")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON to PATH, - for stdout")
+    args = parser.parse_args()
+
+    log = sys.stderr if args.json == "-" else sys.stdout
+    report = {"perft": [], "search": []}
+    if not args.no_perft:
+        board_names = list(BOARD_CLASSES) if args.board == "both" else [args.board]
+        for board_name in board_names:
+            report["perft"] += run_perft(board_name, args.perft_depth, log)
+    if args.check:
+        report["check"] = run_check(log) + run_batch_check(log)
+    elif not args.no_search:
+        report["search"] = run_search(args.search_depth, log)
+
+    perft_ok = all(result["ok"] for result in report["perft"])
+    report["perft_ok"] = perft_ok
+    check_ok = all(result["ok"] for result in report.get("check", []))
+    if report["search"]:
+        nodes = sum(result["nodes"] for result in report["search"])
+        elapsed = sum(result["time"] for result in report["search"])
+        report["search_nodes"] = nodes
+        report["search_time"] = elapsed
+        print(f"search total: {nodes} nodes in {elapsed:.2f}s, {nodes / elapsed:.0f} nodes/s", file=log)
+
+    if args.clock is not None:
+        report["clock"] = run_clock(args.clock, args.increment, log)
+
+    if args.memory:
+        report["memory"] = run_memory(args.memory, log)
+
+    if args.selectivity:
+        report["selectivity"] = {}
+        for variant, settings in SELECTIVE_VARIANTS.items():
+            results = report["search"] if variant == "all" and report["search"] else run_search(args.search_depth, log, settings)
+            nodes = sum(result["nodes"] for result in results)
+            elapsed = sum(result["time"] for result in results)
+            report["selectivity"][variant] = {"nodes": nodes, "time": elapsed, "moves": [result["move"] for result in results]}
+        all_nodes = report["selectivity"]["all"]["nodes"]
+        for variant, result in report["selectivity"].items():
+            print(f"selectivity {variant:14} {result['nodes']:>9} nodes ({result['nodes'] / all_nodes:5.2f}x)  {result['time']:7.2f}s", file=log)
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not perft_ok:
+        print("PERFT MISMATCH: the move generation or the rules changed", file=sys.stderr)
+        return 1
+    if not check_ok:
+        print("CHECK FAILED: make_move and unmake_move disagree with the move generation or do not restore the board", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
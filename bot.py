@@ -66,10 +66,10 @@ class Bot():
 
     def generate_moves(self) -> list[Move]:
         moves = []
-        for piece in self.board.board:
-            if piece is None or piece.color != self.board.turn:
+        for piece in self.board.pieces():
+            if piece.color != self.board.turn:
                 continue
-            piece_moves = [Move(piece.row, piece.col, row, col) for row, col in piece.legal_moves()]
+            piece_moves = [Move(piece.row, piece.col, row, col) for row, col in piece.legal_moves(self.board)]
             moves.extend(piece_moves)
         return moves
     
@@ -82,10 +82,10 @@ class Bot():
             list[Move]: A list of all the interesting moves for the current player.
         '''
         moves = []
-        for piece in self.board.board:
-            if piece is None or piece.color != self.board.turn:
+        for piece in self.board.pieces():
+            if piece.color != self.board.turn:
                 continue
-            for row, col in piece.legal_moves():
+            for row, col in piece.legal_moves(self.board):
                 move = Move(piece.row, piece.col, row, col)
                 if self.board.move_is_capture(move):
                     moves.append(move)
@@ -111,9 +111,7 @@ class Bot():
     def evaluate(self) -> int:
         self.numpos += 1
         score = 0
-        for piece in self.board.board:
-            if piece is None:
-                continue
+        for piece in self.board.pieces():
 
             multiplier = 1 if piece.color == self.board.turn else -1
             score += VALUES[piece.color] * multiplier
@@ -125,7 +123,7 @@ class Bot():
                     return (MATE_SCORE - self.cur_max_depth) * multiplier
                 score += king_distance * 50 * multiplier
 
-                king_moves = len(piece.legal_moves())
+                king_moves = len(piece.legal_moves(self.board))
                 score += king_moves * 10 * multiplier
 
         return score
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from scripts.netclient import RandomPlayer, BotPlayer, GameResult, play_match, WIN, LOSS, ABORTED, ERROR
+from scripts.constants import PORT, BLACK
+
+PLAYERS = ("random", "bot")
+
+def make_player(kind: str, seed: int, args: argparse.Namespace):
+    if kind == "bot":
+        return BotPlayer(args.depth, args.time, args.tt_size, args.clock, args.increment)
+    return RandomPlayer(seed)
+
+def percentile(values: list[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+def report(results: list[tuple[GameResult, GameResult]], kinds: tuple[str, str], elapsed: float) -> None:
+    '''
+    Print the score of each side of the matches and the round trip times of the moves.
+    '''
+    games = len(results)
+    finished = [game for game in results if all(result.result in (WIN, LOSS) for result in game)]
+    print(f"{games} games in {elapsed:.1f}s ({games / elapsed:.1f} games/s), {len(finished)} finished, "
+          f"{sum(1 for game in results if any(result.result == ABORTED for result in game))} aborted, "
+          f"{sum(1 for game in results if any(result.result == ERROR for result in game))} with errors")
+    for side in (0, 1):
+        side_results = [game[side] for game in results]
+        wins = sum(1 for result in side_results if result.result == WIN)
+        black_wins = sum(1 for result in side_results if result.result == WIN and result.color == BLACK)
+        think = sum(result.think_time for result in side_results)
+        moves = sum(len(result.move_times) for result in side_results)
+        print(f"  side {side} ({kinds[side]}): {wins} wins ({black_wins} as black), {think / max(1, moves) * 1000:.2f} ms thinking per move")
+    errors = {result.error for game in results for result in game if result.error}
+    for error in sorted(errors):
+        print(f"  error: {error}")
+
+    move_times = [t for game in results for result in game for t in result.move_times]
+    plies = [game[0].plies for game in results]
+    if move_times:
+        print(f"{len(move_times)} moves, {sum(plies) / len(plies):.1f} plies per game, round trip "
+              f"p50 {percentile(move_times, 0.5) * 1000:.2f} ms, p99 {percentile(move_times, 0.99) * 1000:.2f} ms, "
+              f"max {max(move_times) * 1000:.2f} ms")
+
+async def run(args: argparse.Namespace) -> list[tuple[GameResult, GameResult]]:
+    options = dict(host=args.host, port=args.port, binary=not args.text, max_plies=args.max_plies)
+    matches = []
+    for match in range(args.sessions):
+        players = (make_player(args.players[0], args.seed + 2 * match, args), make_player(args.players[1], args.seed + 2 * match + 1, args))
+        names = (f"{args.prefix}{match}a", f"{args.prefix}{match}b")
+        matches.append((players, play_match(players, names, args.games, args.size, **options)))
+
+    try:
+        results = await asyncio.gather(*(match for _, match in matches))
+    finally:
+        for players, _ in matches:
+            for player in players:
+                player.close()
+    return [game for match in results for game in match]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Headless clients playing games on a server, to load test it or to run matches over the network.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--size", type=int, choices=(9, 11), default=9, help="board size (default: 9)")
+    parser.add_argument("--sessions", type=int, default=1, help="matches played at the same time, two clients each (default: 1)")
+    parser.add_argument("--games", type=int, default=2, help="games of every match, the sides take turns at moving first (default: 2)")
+    parser.add_argument("--players", nargs=2, choices=PLAYERS, default=["random", "random"], help="players of the two sides (default: random random)")
+    parser.add_argument("--depth", type=int, help="maximum search depth of the bot")
+    parser.add_argument("--time", type=float, help="time per move of the bot in seconds, when it has no clock")
+    parser.add_argument("--clock", type=float, help="game clock of the bot in seconds, its time manager shares it out over the moves")
+    parser.add_argument("--increment", type=float, default=0, help="seconds added to the clock of the bot after every move (default: 0)")
+    parser.add_argument("--tt-size", type=float, default=4, help="transposition table of every bot in MB (default: 4)")
+    parser.add_argument("--max-plies", type=int, default=400, help="games longer than this are aborted (default: 400)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random players (default: 0)")
+    parser.add_argument("--prefix", default="hc", help="prefix of the client names, the same prefix twice on a server mixes the matches (default: hc)")
+    parser.add_argument("--text", action="store_true", help="use the text protocol instead of the binary one")
+    args = parser.parse_args()
+
+    if len(f"{args.prefix}{args.sessions - 1}a") > 16:
+        parser.error("--prefix is too long for that many sessions, names have up to 16 characters")
+    if args.increment and args.clock is None:
+        parser.error("--increment needs --clock")
+
+    start = time.perf_counter()
+    results = asyncio.run(run(args))
+    report(results, tuple(args.players), time.perf_counter() - start)
+    return 0 if all(result.result != ERROR for game in results for result in game) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
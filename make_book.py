@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+
+from scripts.bot import Bot, OPENING_BOOK_PATH, BATCH_ORDER_DEPTH, generate_moves
+from scripts.book import BookEntry, write_book, read_book
+from scripts.move import move_from_packed
+
+INF = float('inf')
+
+def build_book(size: int, plies: int, branching: int, depth: int, max_time: float, log=sys.stdout) -> list[BookEntry]:
+    '''
+    Search the positions of the first plies of a board size and keep the best move of each.
+
+    From every position the best move and the next most promising moves (by the move
+    ordering of the bot, up to branching moves in total) are followed, so the book also
+    answers the common replies of the opponent.
+
+    Parameters:
+        size (int): The board size.
+        plies (int): The number of plies from the starting position covered by the book.
+        branching (int): The number of moves followed from every position.
+        depth (int): The search depth of every position.
+        max_time (float): The time limit of every search in seconds.
+
+    Returns:
+        list[BookEntry]: One entry per position.
+    '''
+    bot = Bot(size, 0)
+    bot.use_opening_book = False
+    bot.max_depth = depth
+    bot.max_time = max_time
+    board = bot.board
+
+    entries: dict[int, BookEntry] = {}
+    def expand(ply: int) -> None:
+        if board.hash in entries or board.winner is not None:
+            return
+
+        evals = []
+        bot.color = board.turn
+        bot.iteration_callback = lambda cur_depth, eval, move: evals.append(eval)
+        start = time.perf_counter()
+        move = bot.search()
+        packed = move.pack(size)
+        entries[board.hash] = (board.hash, packed, 1, int(evals[-1]) if evals and abs(evals[-1]) != INF else 0)
+        print(f"book {size}x{size} ply {ply}: {' '.join(str(m) for m in board.list_of_moves) or 'start'} -> {move}  {time.perf_counter() - start:.1f}s", file=log)
+
+        if ply + 1 >= plies:
+            return
+        for candidate in bot.order_moves(generate_moves(board), packed, depth=BATCH_ORDER_DEPTH)[:branching]:
+            board.move_piece_by_move(move_from_packed(candidate, size))
+            expand(ply + 1)
+            board.undo_move()
+
+    expand(0)
+    bot.close()
+    return list(entries.values())
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build the opening book of the bot.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[9, 11], help="board sizes (default: 9 11)")
+    parser.add_argument("--plies", type=int, default=4, help="plies from the starting position covered by the book (default: 4)")
+    parser.add_argument("--branching", type=int, default=3, help="moves followed from every position (default: 3)")
+    parser.add_argument("--depth", type=int, default=5, help="search depth of every position (default: 5)")
+    parser.add_argument("--time", type=float, default=30, help="time limit of every search in seconds (default: 30)")
+    parser.add_argument("--output", default=OPENING_BOOK_PATH, help=f"book file (default: {OPENING_BOOK_PATH})")
+    parser.add_argument("--merge", action="store_true", help="keep the entries of the existing book for the positions not searched again")
+    args = parser.parse_args()
+
+    entries: dict[int, BookEntry] = {}
+    if args.merge:
+        try:
+            entries = {entry[0]: entry for entry in read_book(args.output)}
+        except (OSError, ValueError) as e:
+            print(f"Not merging: {e}")
+    for size in args.sizes:
+        for entry in build_book(size, args.plies, args.branching, args.depth, args.time):
+            entries[entry[0]] = entry
+
+    write_book(args.output, list(entries.values()))
+    print(f"Wrote {len(entries)} positions to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import argparse
+import os
+import sys
+import time
+from array import array
+from itertools import combinations
+from math import comb
+
+from scripts.bitboard import BitBoard, iter_bits
+from scripts.bot import TABLEBASE_PATH
+from scripts.constants import WHITE, BLACK
+from scripts.move import MOVE_SQUARE_BITS, MOVE_SQUARE_MASK
+from scripts.tablebase import HEADER, CLASS_ENTRY, TABLEBASE_MAGIC, TABLEBASE_VERSION, WIN, LOSS, encode_result, decode_result, rank_squares, class_size
+
+def square_sets(num_squares: int, count: int) -> list[int]:
+    '''
+    Every set of count squares as a mask, indexed by rank_squares.
+    '''
+    masks = [0] * comb(num_squares, count)
+    for squares in combinations(range(num_squares), count):
+        mask = 0
+        for sq in squares:
+            mask |= 1 << sq
+        masks[rank_squares(mask)] = mask
+    return masks
+
+class MaterialClass:
+    '''
+    Index of the positions of the king with a given number of attackers and defenders.
+    '''
+    def __init__(self, num_squares: int, attackers: int, defenders: int):
+        self.attackers = attackers
+        self.defenders = defenders
+        self.num_squares = num_squares
+        self.attacker_sets = square_sets(num_squares, attackers)
+        self.defender_sets = square_sets(num_squares, defenders)
+        self.size = class_size(num_squares, attackers, defenders)
+
+    def index(self, turn: int, king: int, attackers: int, defenders: int) -> int:
+        index = ((king.bit_length() - 1) * len(self.attacker_sets) + rank_squares(attackers)) * len(self.defender_sets) + rank_squares(defenders)
+        return index + self.size if turn == BLACK else index
+
+    def position(self, index: int) -> tuple[int, int, int, int]:
+        '''
+        Returns:
+            tuple[int, int, int, int]: (turn, king mask, attackers mask, defenders mask) of an index.
+        '''
+        turn = WHITE
+        if index >= self.size:
+            turn = BLACK
+            index -= self.size
+        index, defenders_rank = divmod(index, len(self.defender_sets))
+        king_sq, attackers_rank = divmod(index, len(self.attacker_sets))
+        return turn, 1 << king_sq, self.attacker_sets[attackers_rank], self.defender_sets[defenders_rank]
+
+def solve_class(board: BitBoard, material: MaterialClass, solved: dict[tuple[int, int], tuple[MaterialClass, bytearray]], log=sys.stdout) -> bytearray:
+    '''
+    Retrograde analysis of a material class. Moves that capture lead to classes with less
+    material, which must already be in solved.
+
+    Positions are finalised in order of distance to the end of the game: a position is a
+    win in n + 1 plies if one of its moves leads to a loss in n plies for the opponent, and
+    a loss in n + 1 plies once all its moves lead to wins for the opponent, the longest
+    in n plies. Positions never finalised are draws.
+
+    Returns:
+        bytearray: The result byte of every index of the class.
+    '''
+    geometry = board.geometry
+    corners = geometry.corner_mask
+    castles = geometry.castle_mask
+    total = 2 * material.size
+
+    values = bytearray(total)
+    final = bytearray(total)
+    unknown = array('H', bytes(2 * total))       # Moves not yet known to lose, for the positions not finalised
+    longest_loss = array('B', bytes(total))       # Longest win of the opponent among the moves known to lose
+    buckets: dict[int, list[tuple[int, int]]] = {}  # distance -> (index, WIN or LOSS)
+
+    def push(distance: int, index: int, result: int) -> None:
+        bucket = buckets.get(distance)
+        if bucket is None:
+            bucket = buckets[distance] = []
+        bucket.append((index, result))
+
+    # Forward pass: count the moves of every position and score the ones that end the game or capture
+    start = time.perf_counter()
+    positions = 0
+    for index in range(total):
+        turn, king, attackers, defenders = material.position(index)
+        if king & corners or (attackers | defenders) & castles or attackers & defenders or king & (attackers | defenders):
+            continue
+        positions += 1
+        board.king, board.attackers, board.defenders, board.turn = king, attackers, defenders, turn
+
+        moves = board.packed_moves()
+        if not moves:
+            push(0, index, LOSS)
+            continue
+
+        targets = board.capture_targets(turn)
+        in_class = 0
+        best_win = None
+        for move in moves:
+            from_sq = move & MOVE_SQUARE_MASK
+            to_sq = move >> MOVE_SQUARE_BITS
+            if king >> from_sq & 1 and corners >> to_sq & 1:
+                best_win = 1
+                continue
+            captured = board.captures(from_sq, to_sq) if targets >> to_sq & 1 else 0
+            if not captured:
+                in_class += 1
+                continue
+            if captured & king:
+                best_win = 1
+                continue
+
+            # The position after the capture, with the other side to move
+            move_mask = (1 << from_sq) | (1 << to_sq)
+            child_king = king ^ move_mask if king >> from_sq & 1 else king
+            child_attackers = (attackers ^ move_mask if attackers >> from_sq & 1 else attackers) & ~captured
+            child_defenders = (defenders ^ move_mask if defenders >> from_sq & 1 else defenders) & ~captured
+            child_material, child_values = solved[(child_attackers.bit_count(), child_defenders.bit_count())]
+            result, distance = decode_result(child_values[child_material.index(1 - turn, child_king, child_attackers, child_defenders)])
+            if result == LOSS:
+                if best_win is None or distance + 1 < best_win:
+                    best_win = distance + 1
+            elif result == WIN:
+                longest_loss[index] = max(longest_loss[index], distance)
+            else:
+                in_class += 1   # A draw, it never counts as a losing move
+
+        unknown[index] = in_class
+        if best_win is not None:
+            push(best_win, index, WIN)
+        elif in_class == 0:
+            push(longest_loss[index] + 1, index, LOSS)
+
+    # Backward pass: finalise the positions by distance and update their predecessors
+    wins = losses = 0
+    distance = 0
+    while buckets:
+        bucket = buckets.pop(distance, None)
+        distance += 1
+        if bucket is None:
+            continue
+        for index, result in bucket:
+            if final[index]:
+                continue
+            final[index] = 1
+            values[index] = encode_result(result, distance - 1)
+            if result == WIN:
+                wins += 1
+            else:
+                losses += 1
+
+            # Predecessors: the side that just moved had one of its pieces on another square of its rays
+            turn, king, attackers, defenders = material.position(index)
+            mover = 1 - turn
+            occupied = king | attackers | defenders
+            board.king, board.attackers, board.defenders, board.turn = king, attackers, defenders, mover
+            pieces = defenders | king if mover == WHITE else attackers
+            for to_sq in iter_bits(pieces):
+                to_bit = 1 << to_sq
+                for from_sq in iter_bits(board.piece_moves(to_sq, occupied)):
+                    from_bit = 1 << from_sq
+                    if king & to_bit:
+                        if from_bit & corners:
+                            continue
+                        board.king = from_bit
+                    elif attackers & to_bit:
+                        board.attackers = attackers ^ to_bit ^ from_bit
+                    else:
+                        board.defenders = defenders ^ to_bit ^ from_bit
+                    if not board.captures(from_sq, to_sq):
+                        previous = material.index(mover, board.king, board.attackers, board.defenders)
+                        if not final[previous]:
+                            if result == LOSS:
+                                push(distance, previous, WIN)
+                            else:
+                                longest_loss[previous] = max(longest_loss[previous], distance - 1)
+                                unknown[previous] -= 1
+                                if unknown[previous] == 0:
+                                    push(longest_loss[previous] + 1, previous, LOSS)
+                    board.king, board.attackers, board.defenders = king, attackers, defenders
+
+    print(f"tablebase {material.attackers} attackers {material.defenders} defenders: {positions} positions, {wins} wins, {losses} losses, {positions - wins - losses} draws, longest {distance - 1} plies  {time.perf_counter() - start:.1f}s", file=log)
+    return values
+
+def build_tablebase(size: int, max_attackers: int, max_defenders: int, max_pieces: int, log=sys.stdout) -> list[tuple[int, int, bytearray]]:
+    '''
+    Solve every class with up to max_attackers attackers, max_defenders defenders and
+    max_pieces pieces besides the king, from the least material up.
+
+    Returns:
+        list[tuple[int, int, bytearray]]: (attackers, defenders, values) of every class.
+    '''
+    board = BitBoard(size, size)
+    solved: dict[tuple[int, int], tuple[MaterialClass, bytearray]] = {}
+    for pieces in range(max_pieces + 1):
+        for attackers in range(min(pieces, max_attackers) + 1):
+            defenders = pieces - attackers
+            if defenders > max_defenders:
+                continue
+            material = MaterialClass(size * size, attackers, defenders)
+            solved[(attackers, defenders)] = material, solve_class(board, material, solved, log)
+    return [(attackers, defenders, values) for (attackers, defenders), (_, values) in solved.items()]
+
+def write_tablebase(path: str, size: int, classes: list[tuple[int, int, bytearray]]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(TABLEBASE_MAGIC, TABLEBASE_VERSION, size, size, len(classes)))
+        offset = HEADER.size + len(classes) * CLASS_ENTRY.size
+        for attackers, defenders, values in classes:
+            f.write(CLASS_ENTRY.pack(attackers, defenders, offset))
+            offset += len(values)
+        for _, _, values in classes:
+            f.write(values)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build the endgame tablebase of the bot by retrograde analysis.")
+    parser.add_argument("--size", type=int, default=9, help="board size (default: 9)")
+    parser.add_argument("--attackers", type=int, default=2, help="maximum number of attackers (default: 2)")
+    parser.add_argument("--defenders", type=int, default=1, help="maximum number of defenders (default: 1)")
+    parser.add_argument("--pieces", type=int, default=2, help="maximum number of pieces besides the king (default: 2)")
+    parser.add_argument("--output", default=TABLEBASE_PATH, help=f"tablebase file (default: {TABLEBASE_PATH})")
+    args = parser.parse_args()
+
+    classes = build_tablebase(args.size, args.attackers, args.defenders, args.pieces)
+    write_tablebase(args.output, args.size, classes)
+    print(f"Wrote {len(classes)} classes, {sum(len(values) for _, _, values in classes)} positions to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from scripts.bitboard import BitBoard
+
+import numpy as np
+
+from scripts.constants import WHITE
+from scripts.pieces import EMPTY, ATTACKER_CODE, DEFENDER_CODE, KING_CODE
+from scripts.move import MOVE_SQUARE_BITS, MOVE_SQUARE_MASK
+from scripts.evaluation import MATE_SCORE, KING_MOBILITY_WEIGHT, ATTACKER_PROXIMITY_WEIGHT, piece_square_tables, corner_distance
+
+class BatchGeometry:
+    '''
+    NumPy versions of the evaluation tables of a board size.
+    '''
+    def __init__(self, width: int, height: int):
+        num_squares = width * height
+        self.squares = np.arange(num_squares)
+
+        # tables[code, square], the empty code scores 0
+        tables = piece_square_tables(width, height)
+        self.tables = np.zeros((4, num_squares), dtype=np.int32)
+        for kind, table in enumerate(tables):
+            self.tables[kind + 1] = table
+
+        self.corners = np.array([corner_distance(sq // width, sq % width, width, height) == 0 for sq in range(num_squares)])
+
+        # rays[square, direction] lists the squares a piece slides over from the square, padded
+        # with num_squares, which stands for an occupied square off the board
+        max_length = max(width, height)
+        self.rays = np.full((num_squares, 4, max_length), num_squares)
+
+        # Index of the four neighbours of every square, the square itself for the ones off the board
+        self.neighbours = np.repeat(self.squares[:, None], 4, axis=1)
+        for sq in range(num_squares):
+            row, col = divmod(sq, width)
+            for i, (dr, dc) in enumerate(((0, 1), (0, -1), (1, 0), (-1, 0))):
+                if 0 <= row + dr < height and 0 <= col + dc < width:
+                    self.neighbours[sq, i] = (row + dr) * width + col + dc
+                steps = 1
+                while 0 <= row + steps * dr < height and 0 <= col + steps * dc < width:
+                    self.rays[sq, i, steps - 1] = (row + steps * dr) * width + col + steps * dc
+                    steps += 1
+
+_GEOMETRY: dict[tuple[int, int], BatchGeometry] = {}
+
+def get_batch_geometry(width: int, height: int) -> BatchGeometry:
+    geometry = _GEOMETRY.get((width, height))
+    if geometry is None:
+        geometry = _GEOMETRY[(width, height)] = BatchGeometry(width, height)
+    return geometry
+
+def mask_to_array(mask: int, num_squares: int) -> np.ndarray:
+    data = np.frombuffer(mask.to_bytes((num_squares + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(data, bitorder='little')[:num_squares]
+
+def board_array(board: BitBoard) -> np.ndarray:
+    '''
+    Returns the board as a flat int8 array of square codes.
+    '''
+    num_squares = board.width * board.height
+    squares = mask_to_array(board.attackers, num_squares).astype(np.int8) * ATTACKER_CODE
+    squares += mask_to_array(board.defenders, num_squares).astype(np.int8) * DEFENDER_CODE
+    squares += mask_to_array(board.king, num_squares).astype(np.int8) * KING_CODE
+    return squares
+
+def child_arrays(board: BitBoard, moves: list[int]) -> np.ndarray:
+    '''
+    Build the positions after each of the packed moves, without playing them on the board.
+
+    Returns:
+        np.ndarray: int8 array of shape (len(moves), height, width) with the square codes.
+    '''
+    width = board.width
+    parent = board_array(board)
+    packed = np.array(moves, dtype=np.int64)
+    from_sq = packed & MOVE_SQUARE_MASK
+    to_sq = packed >> MOVE_SQUARE_BITS
+    rows = np.arange(len(moves))
+
+    children = np.tile(parent, (len(moves), 1))
+    children[rows, to_sq] = parent[from_sq]
+    children[rows, from_sq] = EMPTY
+
+    # Only the moves that land on a capture target remove pieces
+    capture_targets = board.capture_targets(board.turn)
+    for i, move in enumerate(moves):
+        target = move >> MOVE_SQUARE_BITS
+        if capture_targets >> target & 1:
+            captured = board.captures(move & MOVE_SQUARE_MASK, target)
+            while captured:
+                bit = captured & -captured
+                children[i, bit.bit_length() - 1] = EMPTY
+                captured ^= bit
+
+    return children.reshape(len(moves), board.height, width)
+
+def evaluate_batch(boards: np.ndarray, turn: int) -> np.ndarray:
+    '''
+    Static evaluation of a batch of positions with the terms of Bot.evaluate: material,
+    piece-square tables, the mobility of the king and the number of attackers around it.
+    Positions where the king was captured or reached a corner are over and score
+    -MATE_SCORE and MATE_SCORE for white.
+
+    Parameters:
+        boards (np.ndarray): int8 array of shape (N, height, width) with the square codes.
+        turn (int): The color the scores are given for.
+
+    Returns:
+        np.ndarray: The N scores.
+    '''
+    num_boards, height, width = boards.shape
+    geometry = get_batch_geometry(width, height)
+    squares = boards.reshape(num_boards, -1)
+    scores = geometry.tables[squares, geometry.squares].sum(axis=1)
+
+    kings = squares == KING_CODE
+    has_king = kings.any(axis=1)
+    king_sq = kings.argmax(axis=1)
+
+    # The king slides up to the first occupied square of each ray, the padding stops the others
+    occupied = np.ones((num_boards, squares.shape[1] + 1), dtype=bool)
+    occupied[:, :-1] = squares != EMPTY
+    blocked = np.take_along_axis(occupied, geometry.rays[king_sq].reshape(num_boards, -1), axis=1)
+    scores += blocked.reshape(num_boards, 4, -1).argmax(axis=2).sum(axis=1) * KING_MOBILITY_WEIGHT
+
+    # The king square itself stands for the neighbours off the board, it never holds an attacker
+    around_king = np.take_along_axis(squares, geometry.neighbours[king_sq], axis=1)
+    scores -= (around_king == ATTACKER_CODE).sum(axis=1) * ATTACKER_PROXIMITY_WEIGHT
+
+    scores = np.where(geometry.corners[king_sq], MATE_SCORE, scores)
+    scores = np.where(has_king, scores, -MATE_SCORE)
+    return scores if turn == WHITE else -scores
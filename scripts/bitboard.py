@@ -0,0 +1,714 @@
+from __future__ import annotations
+
+from scripts.constants import WHITE, BLACK, ROOK, KING, DEBUG
+from scripts.board import STARTING_POSITIONS, ADJECENT_SQUARES, ZOBRIST_TABLE, ZOBRIST_BLACK_TO_MOVE, ATTACKER, DEFENDER, KING_KIND, piece_kind, zobrist_hash
+from scripts.pieces import Piece
+from scripts.evaluation import piece_square_tables
+from scripts.move import Move, MOVE_SQUARE_BITS, MOVE_SQUARE_MASK, CAPTURE_SHIFT
+
+# Direction indexes, in the same order as ADJECENT_SQUARES
+EAST, WEST, SOUTH, NORTH = 0, 1, 2, 3
+
+MAX_SEARCH_PLY = 128
+UNDO_ENTRY_SIZE = 4     # Packed move with its captures, reversible moves, piece score and king mask before the move
+
+_GEOMETRY: dict[tuple[int, int], BoardGeometry] = {}
+
+class BoardGeometry:
+    '''
+    Precomputed masks for a board size. Square index is row * width + col and
+    square n is stored in bit n of every mask.
+    '''
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.num_squares = width * height
+        self.full = (1 << self.num_squares) - 1
+
+        first_col = 0
+        last_col = 0
+        for row in range(height):
+            first_col |= 1 << (row * width)
+            last_col |= 1 << (row * width + width - 1)
+        self.not_first_col = self.full & ~first_col
+        self.not_last_col = self.full & ~last_col
+
+        corners = [(0, 0), (0, width - 1), (height - 1, 0), (height - 1, width - 1)]
+        self.corner_mask = 0
+        for row, col in corners:
+            self.corner_mask |= 1 << (row * width + col)
+        self.center = (height // 2) * width + width // 2
+        self.castle_mask = self.corner_mask | (1 << self.center)
+        self.edge_mask = self.full & ~(self.shift(self.full, EAST) & self.shift(self.full, WEST) & self.shift(self.full, SOUTH) & self.shift(self.full, NORTH))
+
+        self.coords = [divmod(sq, width) for sq in range(self.num_squares)]
+        self.neighbours = [0] * self.num_squares
+        for sq in range(self.num_squares):
+            for direction in range(4):
+                self.neighbours[sq] |= self.shift(1 << sq, direction)
+
+        # rays[direction][square] holds every square from square (excluded) to the edge
+        self.rays: list[list[int]] = []
+        for dr, dc in ADJECENT_SQUARES:
+            rays = []
+            for sq in range(self.num_squares):
+                row, col = self.coords[sq]
+                ray = 0
+                r, c = row + dr, col + dc
+                while 0 <= r < height and 0 <= c < width:
+                    ray |= 1 << (r * width + c)
+                    r, c = r + dr, c + dc
+                rays.append(ray)
+            self.rays.append(rays)
+
+    def shift(self, mask: int, direction: int) -> int:
+        if direction == EAST:
+            return (mask << 1) & self.not_first_col
+        if direction == WEST:
+            return (mask >> 1) & self.not_last_col
+        if direction == SOUTH:
+            return (mask << self.width) & self.full
+        return mask >> self.width
+
+def get_geometry(width: int, height: int) -> BoardGeometry:
+    geometry = _GEOMETRY.get((width, height))
+    if geometry is None:
+        geometry = _GEOMETRY[(width, height)] = BoardGeometry(width, height)
+    return geometry
+
+def iter_bits(mask: int):
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length() - 1
+        mask ^= bit
+
+class BitBoard:
+    '''
+    Board representation where attackers (black rooks), defenders (white rooks)
+    and the king are stored as one integer mask each.
+
+    It exposes the same game API as Board (move_piece, move_piece_by_move,
+    undo_move, check_winner, get_piece, ...) so it can be used wherever a
+    non visual Board is expected, but queries are answered with mask operations.
+    '''
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+
+        self.ready = False
+        self.player1 = "Blue"
+        self.player2 = "Red"
+
+        self.reset(width, height)
+
+    def reset(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self.geometry = get_geometry(width, height)
+        self.piece_square_tables = piece_square_tables(width, height)
+
+        self.attackers = 0
+        self.defenders = 0
+        self.king = 0
+        self.hash = 0
+        self.piece_score = 0    # Material and piece-square score from white's point of view, kept up to date like the hash
+
+        self.turn = BLACK
+        self.winner = None
+        self.list_of_moves: list[Move] = []
+        self.selected_piece: Piece = None
+
+        # Undo stack of make_move, one UNDO_ENTRY_SIZE entry per ply, allocated once
+        self.ply = 0
+        self.undo_stack = [0] * (MAX_SEARCH_PLY * UNDO_ENTRY_SIZE)
+
+        # Hash of the position before every move played, the moves of list_of_moves then the
+        # moves of the search, and the number of moves since the last capture (or null move):
+        # only the positions of that window can be repeated
+        self.hash_stack: list[int] = []
+        self.reversible_moves = 0
+
+        self.END_POSITIONS = [(0, 0), (0, self.width - 1), (self.height - 1, 0), (self.height - 1, self.width - 1)]
+        self.CASTLE_POSITIONS = [(0, 0), (0, self.width - 1), (self.height - 1, 0), (self.height - 1, self.width - 1), (self.height // 2, self.width // 2)]
+
+        self.starting_position()
+
+    def starting_position(self) -> None:
+        for row, col, color, type_p in STARTING_POSITIONS[f"{self.height}x{self.width}"]:
+            self.put(row * self.width + col, color, type_p)
+        self.hash = zobrist_hash(self)
+
+    def put(self, sq: int, color: int, type_p: int) -> None:
+        bit = 1 << sq
+        self.piece_score += self.piece_square_tables[piece_kind(color, type_p)][sq]
+        if type_p == KING:
+            self.king |= bit
+        elif color == WHITE:
+            self.defenders |= bit
+        else:
+            self.attackers |= bit
+
+    @property
+    def occupied(self) -> int:
+        return self.attackers | self.defenders | self.king
+
+    def side_mask(self, color: int) -> int:
+        return self.defenders | self.king if color == WHITE else self.attackers
+
+    def piece_at(self, sq: int) -> tuple[int, int] | None:
+        '''
+        Returns the (color, type) of the piece on a square, or None if it is empty.
+        '''
+        bit = 1 << sq
+        if self.attackers & bit:
+            return BLACK, ROOK
+        if self.defenders & bit:
+            return WHITE, ROOK
+        if self.king & bit:
+            return WHITE, KING
+        return None
+
+    def get_piece(self, row: int, col: int) -> Piece:
+        if row < 0 or row >= self.height or col < 0 or col >= self.width:
+            return None
+
+        piece = self.piece_at(row * self.width + col)
+        if piece is None:
+            return None
+        return Piece(row, col, *piece)
+
+    def piece_moves(self, sq: int, occupied: int = None) -> int:
+        '''
+        Returns the mask of squares the piece on sq can move to.
+        '''
+        if occupied is None:
+            occupied = self.occupied
+        rays = self.geometry.rays
+
+        # East and south rays go towards higher bits: the nearest blocker is the lowest bit
+        ray = rays[EAST][sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1
+            ray ^= rays[EAST][blocker] | (1 << blocker)
+        dest = ray
+
+        ray = rays[SOUTH][sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1
+            ray ^= rays[SOUTH][blocker] | (1 << blocker)
+        dest |= ray
+
+        # West and north rays go towards lower bits: the nearest blocker is the highest bit
+        ray = rays[WEST][sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = blockers.bit_length() - 1
+            ray ^= rays[WEST][blocker] | (1 << blocker)
+        dest |= ray
+
+        ray = rays[NORTH][sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = blockers.bit_length() - 1
+            ray ^= rays[NORTH][blocker] | (1 << blocker)
+        dest |= ray
+
+        if not self.king >> sq & 1:
+            dest &= ~self.geometry.castle_mask
+        return dest
+
+    def generate_moves(self, color: int = None):
+        '''
+        Lazily yield the legal moves of the given color (the side to move by default) as Move objects.
+        '''
+        if color is None:
+            color = self.turn
+        occupied = self.occupied
+        coords = self.geometry.coords
+        for from_sq in iter_bits(self.side_mask(color)):
+            from_row, from_col = coords[from_sq]
+            for to_sq in iter_bits(self.piece_moves(from_sq, occupied)):
+                to_row, to_col = coords[to_sq]
+                yield Move(from_row, from_col, to_row, to_col, self.height)
+
+    def packed_moves(self, color: int = None, moves: list[int] = None) -> list[int]:
+        '''
+        Generate the legal moves of the given color (the side to move by default), packed with pack_move.
+
+        Parameters:
+            color (int): The color to move.
+            moves (list[int]): A list to fill instead of allocating a new one, its content is replaced.
+        '''
+        if color is None:
+            color = self.turn
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        append = moves.append
+        occupied = self.occupied
+        for from_sq in iter_bits(self.side_mask(color)):
+            for to_sq in iter_bits(self.piece_moves(from_sq, occupied)):
+                append(from_sq | (to_sq << MOVE_SQUARE_BITS))
+        return moves
+
+    def packed_interesting_moves(self, moves: list[int] = None) -> list[int]:
+        '''
+        Generate the packed moves that capture an enemy piece or put the king on the edge of the board.
+        Like packed_moves, it fills the given list if there is one.
+        '''
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        append = moves.append
+        occupied = self.occupied
+        targets = self.capture_targets(self.turn)
+        for from_sq in iter_bits(self.side_mask(self.turn)):
+            interesting = targets
+            if self.king >> from_sq & 1:
+                interesting |= self.geometry.edge_mask
+            for to_sq in iter_bits(self.piece_moves(from_sq, occupied) & interesting):
+                append(from_sq | (to_sq << MOVE_SQUARE_BITS))
+        return moves
+
+    def has_legal_move(self, color: int) -> bool:
+        geometry = self.geometry
+        occupied = self.occupied
+        empty = geometry.full & ~occupied
+
+        # Fast path: a rook next to an empty square that is not a castle can always move
+        landing = empty & ~geometry.castle_mask
+        rooks = self.defenders if color == WHITE else self.attackers
+        for direction in range(4):
+            if geometry.shift(rooks, direction) & landing:
+                return True
+        if color == WHITE and self.king:
+            for direction in range(4):
+                if geometry.shift(self.king, direction) & empty:
+                    return True
+
+        # Rooks can slide through an empty castle, so check the blocked ones one by one
+        for sq in iter_bits(rooks):
+            if self.piece_moves(sq, occupied):
+                return True
+        return False
+
+    def capture_targets(self, color: int) -> int:
+        '''
+        Returns the mask of the empty squares where a piece of the given color
+        would capture at least one enemy piece by landing on it.
+        '''
+        geometry = self.geometry
+        shift = geometry.shift
+        occupied = self.occupied
+        empty_castles = geometry.castle_mask & ~occupied
+        if color == BLACK:
+            enemies = self.defenders
+            hostile = self.attackers | empty_castles
+        else:
+            enemies = self.attackers
+            hostile = self.defenders | self.king | empty_castles
+
+        # An enemy with a hostile square behind it is captured from the square in front of it
+        targets = 0
+        for direction in range(4):
+            targets |= shift(shift(hostile, direction) & enemies, direction)
+
+        if color == BLACK and self.king:
+            surrounding = self.attackers | empty_castles
+            missing = 0
+            for direction in range(4):
+                missing |= shift(self.king, direction) & ~surrounding
+            # The king is captured when the last free square next to it gets filled
+            if missing & (missing - 1) == 0:
+                targets |= missing
+
+        return targets & ~occupied
+
+    def captures(self, from_sq: int, to_sq: int) -> int:
+        '''
+        Returns the mask of the pieces captured by moving the piece on from_sq to to_sq.
+        '''
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+        attackers = self.attackers
+        defenders = self.defenders
+        king = self.king
+        if king & from_bit:
+            king = to_bit
+        elif attackers & from_bit:
+            attackers ^= from_bit | to_bit
+        else:
+            defenders ^= from_bit | to_bit
+
+        geometry = self.geometry
+        width = self.width
+        full = geometry.full
+        not_first_col = geometry.not_first_col
+        not_last_col = geometry.not_last_col
+        empty_castles = geometry.castle_mask & ~(attackers | defenders | king)
+        if attackers & to_bit:
+            enemies = defenders
+            hostile = attackers | empty_castles
+        else:
+            enemies = attackers
+            hostile = defenders | king | empty_castles
+
+        captured = 0
+        neighbour = (to_bit << 1) & not_first_col & enemies
+        if neighbour and (neighbour << 1) & not_first_col & hostile:
+            captured |= neighbour
+        neighbour = (to_bit >> 1) & not_last_col & enemies
+        if neighbour and (neighbour >> 1) & not_last_col & hostile:
+            captured |= neighbour
+        neighbour = (to_bit << width) & full & enemies
+        if neighbour and (neighbour << width) & full & hostile:
+            captured |= neighbour
+        neighbour = (to_bit >> width) & enemies
+        if neighbour and (neighbour >> width) & hostile:
+            captured |= neighbour
+
+        if attackers & to_bit and king:
+            king_neighbours = ((king << 1) & not_first_col) | ((king >> 1) & not_last_col) | ((king << width) & full) | (king >> width)
+            if king_neighbours & to_bit and not king_neighbours & ~(attackers | empty_castles):
+                captured |= king
+        return captured
+
+    def is_capture(self, from_row: int, from_col: int, to_row: int, to_col: int) -> bool:
+        if (from_row == to_row and from_col == to_col) or (from_row != to_row and from_col != to_col):
+            return False
+
+        from_sq = from_row * self.width + from_col
+        if not self.side_mask(self.turn) >> from_sq & 1:
+            return False
+
+        return self.captures(from_sq, to_row * self.width + to_col) != 0
+
+    def move_is_capture(self, move: Move) -> bool:
+        return self.is_capture(move.from_row, move.from_col, move.to_row, move.to_col)
+
+    def is_to_edge(self, from_row: int, from_col: int, to_row: int, to_col: int) -> bool:
+        if (from_row != to_row and from_col != to_col) or (from_row == to_row and from_col == to_col):
+            return False
+
+        if not self.side_mask(self.turn) >> (from_row * self.width + from_col) & 1:
+            return False
+
+        return bool(self.geometry.edge_mask >> (to_row * self.width + to_col) & 1)
+
+    def move_is_to_edge(self, move: Move) -> bool:
+        return self.is_to_edge(move.from_row, move.from_col, move.to_row, move.to_col)
+
+    def move_piece(self, piece: Piece, row: int, col: int) -> bool:
+        if piece is None:
+            if DEBUG:
+                print("No piece selected")
+            return False
+
+        return self.move_squares(piece.row * self.width + piece.col, row, col)
+
+    def move_piece_by_move(self, move: Move) -> bool:
+        if not (0 <= move.from_row < self.height and 0 <= move.from_col < self.width):
+            return False
+        return self.move_squares(move.from_row * self.width + move.from_col, move.to_row, move.to_col)
+
+    def move_squares(self, from_sq: int, row: int, col: int) -> bool:
+        piece = self.piece_at(from_sq)
+        if piece is None:
+            if DEBUG:
+                print("No piece selected")
+            return False
+
+        if piece[0] != self.turn:
+            if DEBUG:
+                print("Not your turn")
+            return False
+
+        if self.winner is not None:
+            if DEBUG:
+                print("Game is over")
+            return False
+
+        if not (0 <= row < self.height and 0 <= col < self.width) or not self.piece_moves(from_sq) >> (row * self.width + col) & 1:
+            if DEBUG:
+                print("Illegal move")
+            return False
+
+        to_sq = row * self.width + col
+        captured = self.captures(from_sq, to_sq)
+        from_row, from_col = self.geometry.coords[from_sq]
+        self.hash_stack.append(self.hash)
+        self.reversible_moves = 0 if captured else self.reversible_moves + 1
+
+        move_mask = (1 << from_sq) | (1 << to_sq)
+        if piece[1] == KING:
+            self.king ^= move_mask
+        elif piece[0] == WHITE:
+            self.defenders ^= move_mask
+        else:
+            self.attackers ^= move_mask
+        kind = piece_kind(*piece)
+        self.hash ^= ZOBRIST_TABLE[from_sq][kind] ^ ZOBRIST_TABLE[to_sq][kind] ^ ZOBRIST_BLACK_TO_MOVE
+        table = self.piece_square_tables[kind]
+        self.piece_score += table[to_sq] - table[from_sq]
+
+        captured_pieces = ()
+        if captured:
+            captured_pieces = []
+            for sq in iter_bits(captured):
+                captured_row, captured_col = self.geometry.coords[sq]
+                captured_piece = self.piece_at(sq)
+                captured_pieces.append(Piece(captured_row, captured_col, *captured_piece))
+                captured_kind = piece_kind(*captured_piece)
+                self.hash ^= ZOBRIST_TABLE[sq][captured_kind]
+                self.piece_score -= self.piece_square_tables[captured_kind][sq]
+            self.attackers &= ~captured
+            self.defenders &= ~captured
+            self.king &= ~captured
+        move = Move(from_row, from_col, row, col, self.height, bool(captured), tuple(captured_pieces))
+
+        self.list_of_moves.append(move)
+        self.turn = not self.turn
+        self.check_winner()
+
+        return True
+
+    def undo_move(self) -> None:
+        if len(self.list_of_moves) == 0:
+            return
+
+        self.turn = not self.turn
+
+        move = self.list_of_moves.pop()
+        self.hash_stack.pop()
+        if move.is_capture:
+            self.reversible_moves = 0
+            for earlier_move in reversed(self.list_of_moves):
+                if earlier_move.is_capture:
+                    break
+                self.reversible_moves += 1
+        else:
+            self.reversible_moves -= 1
+        from_sq = move.from_row * self.width + move.from_col
+        to_sq = move.to_row * self.width + move.to_col
+        move_mask = (1 << from_sq) | (1 << to_sq)
+        if self.king & move_mask:
+            self.king ^= move_mask
+            kind = KING_KIND
+        elif self.defenders & move_mask:
+            self.defenders ^= move_mask
+            kind = DEFENDER
+        else:
+            self.attackers ^= move_mask
+            kind = ATTACKER
+        self.hash ^= ZOBRIST_TABLE[from_sq][kind] ^ ZOBRIST_TABLE[to_sq][kind] ^ ZOBRIST_BLACK_TO_MOVE
+        table = self.piece_square_tables[kind]
+        self.piece_score += table[from_sq] - table[to_sq]
+
+        if move.is_capture:
+            for captured_piece in move.captured_pieces:
+                sq = captured_piece.row * self.width + captured_piece.col
+                self.put(sq, captured_piece.color, captured_piece.type)
+                self.hash ^= ZOBRIST_TABLE[sq][piece_kind(captured_piece.color, captured_piece.type)]
+
+        if self.winner is not None:
+            self.winner = None
+
+    def make_move(self, move: int) -> int:
+        '''
+        Search version of move_squares: play a packed legal move without checking it and without
+        creating any object. The move goes on the undo stack instead of list_of_moves and must
+        be taken back with unmake_move.
+
+        Returns:
+            int: The move packed with the mask of the pieces it captured.
+        '''
+        from_sq = move & MOVE_SQUARE_MASK
+        to_sq = (move >> MOVE_SQUARE_BITS) & MOVE_SQUARE_MASK
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+        captured = self.captures(from_sq, to_sq)
+        king = self.king
+
+        index = self.ply * UNDO_ENTRY_SIZE
+        stack = self.undo_stack
+        move = from_sq | (to_sq << MOVE_SQUARE_BITS) | (captured << CAPTURE_SHIFT)
+        stack[index] = move
+        stack[index + 1] = self.reversible_moves
+        stack[index + 2] = self.piece_score
+        stack[index + 3] = king
+        self.ply += 1
+        self.hash_stack.append(self.hash)
+        self.reversible_moves = 0 if captured else self.reversible_moves + 1
+
+        if king & from_bit:
+            self.king = to_bit
+            kind = KING_KIND
+        elif self.attackers & from_bit:
+            self.attackers ^= from_bit | to_bit
+            kind = ATTACKER
+        else:
+            self.defenders ^= from_bit | to_bit
+            kind = DEFENDER
+        tables = self.piece_square_tables
+        table = tables[kind]
+        self.hash ^= ZOBRIST_TABLE[from_sq][kind] ^ ZOBRIST_TABLE[to_sq][kind] ^ ZOBRIST_BLACK_TO_MOVE
+        self.piece_score += table[to_sq] - table[from_sq]
+
+        if captured:
+            if kind == ATTACKER:
+                if captured & king:
+                    sq = king.bit_length() - 1
+                    self.hash ^= ZOBRIST_TABLE[sq][KING_KIND]
+                    self.piece_score -= tables[KING_KIND][sq]
+                    self.king = 0
+                    captured ^= king
+                self.defenders ^= captured
+                captured_kind = DEFENDER
+            else:
+                self.attackers ^= captured
+                captured_kind = ATTACKER
+            table = tables[captured_kind]
+            while captured:
+                bit = captured & -captured
+                sq = bit.bit_length() - 1
+                self.hash ^= ZOBRIST_TABLE[sq][captured_kind]
+                self.piece_score -= table[sq]
+                captured ^= bit
+
+        self.turn = not self.turn
+        if not self.king:
+            self.winner = BLACK
+        elif self.king & self.geometry.corner_mask:
+            self.winner = WHITE
+        elif not self.has_legal_move(self.turn):
+            self.winner = BLACK if self.turn == WHITE else WHITE
+        return move
+
+    def unmake_move(self) -> None:
+        '''
+        Take back the last move played with make_move.
+        '''
+        self.ply -= 1
+        index = self.ply * UNDO_ENTRY_SIZE
+        stack = self.undo_stack
+        move = stack[index]
+        self.reversible_moves = stack[index + 1]
+        self.hash = self.hash_stack.pop()
+        self.piece_score = stack[index + 2]
+        king = stack[index + 3]
+
+        to_bit = 1 << ((move >> MOVE_SQUARE_BITS) & MOVE_SQUARE_MASK)
+        move_mask = (1 << (move & MOVE_SQUARE_MASK)) | to_bit
+        captured = move >> CAPTURE_SHIFT
+        if self.attackers & to_bit:
+            self.attackers ^= move_mask
+            self.defenders |= captured & ~king
+        elif self.defenders & to_bit:
+            self.defenders ^= move_mask
+            self.attackers |= captured
+        else:
+            self.attackers |= captured
+        self.king = king
+        self.turn = not self.turn
+        self.winner = None
+
+    def make_null_move(self) -> None:
+        '''
+        Pass the turn, for null-move pruning. It is not recorded in list_of_moves and must be
+        taken back with undo_null_move. Positions before a null move are never repetitions
+        of the positions after it.
+        '''
+        index = self.ply * UNDO_ENTRY_SIZE
+        self.undo_stack[index] = 0
+        self.undo_stack[index + 1] = self.reversible_moves
+        self.ply += 1
+        self.hash_stack.append(self.hash)
+        self.reversible_moves = 0
+        self.turn = not self.turn
+        self.hash ^= ZOBRIST_BLACK_TO_MOVE
+
+    def undo_null_move(self) -> None:
+        self.ply -= 1
+        self.reversible_moves = self.undo_stack[self.ply * UNDO_ENTRY_SIZE + 1]
+        self.hash = self.hash_stack.pop()
+        self.turn = not self.turn
+
+    def is_repetition(self, search_start: int = 0) -> bool:
+        '''
+        Check if the position already occurred with the same side to move since the last capture.
+        A position of the search path, at or after search_start in hash_stack, is a repetition
+        the first time it comes back; a position of the game before the search only the
+        second time, like a threefold repetition.
+        '''
+        stack = self.hash_stack
+        current = self.hash
+        end = len(stack)
+        first = end - self.reversible_moves
+        first += (end - first) & 1      # Same side to move as the current position
+        if current not in stack[first:end - 3:2]:
+            return False
+
+        seen = 0
+        for i in range(end - 4, first - 1, -2):
+            if stack[i] == current:
+                if i >= search_start:
+                    return True
+                seen += 1
+                if seen == 2:
+                    return True
+        return False
+
+    def check_winner(self) -> None:
+        if not self.has_legal_move(self.turn):
+            if DEBUG:
+                print("No legal moves")
+            self.winner = BLACK if self.turn == WHITE else WHITE
+            return
+
+        if not self.king:
+            if DEBUG:
+                print("King captured")
+            self.winner = BLACK
+            return
+
+        if self.king & self.geometry.corner_mask:
+            if DEBUG:
+                print("King in castle")
+            self.winner = WHITE
+            return
+
+    def adjacent_squares(self, row: int, col: int) -> list[tuple[int, int]]:
+        squares = []
+        for dr, dc in ADJECENT_SQUARES:
+            r, c = row + dr, col + dc
+            if 0 <= r < self.height and 0 <= c < self.width:
+                squares.append((r, c))
+        return squares
+
+    def is_empty_castle(self, row: int, col: int) -> bool:
+        if row < 0 or row >= self.height or col < 0 or col >= self.width:
+            return False
+        bit = 1 << (row * self.width + col)
+        return bool(self.geometry.castle_mask & bit) and not self.occupied & bit
+
+    def __str__(self):
+        board_str = ""
+        for row in range(self.height):
+            for col in range(self.width):
+                piece = self.get_piece(row, col)
+                if piece is not None:
+                    board_str += str(piece) + " "
+                else:
+                    board_str += ". "
+            board_str += "\n"
+        return board_str[:-1]
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __hash__(self):
+        return self.hash
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from scripts.bitboard import BitBoard
+
+import mmap
+import os
+import random
+from struct import Struct
+
+# A book file is a header followed by entries sorted by key. Each entry is
+# the Zobrist hash of a position, a packed move (from | to << 7), a weight
+# and the score of the search that chose it. A position can have several
+# entries, one per move.
+BOOK_MAGIC = b"HNBK"
+BOOK_VERSION = 1
+HEADER = Struct('<4sHHI')       # magic, version, entry size, number of entries
+ENTRY = Struct('<QHHi')         # key, move, weight, score
+
+BookEntry = tuple[int, int, int, int]   # (key, move, weight, score)
+
+def write_book(path: str, entries: list[BookEntry]) -> None:
+    '''
+    Write the entries to a book file, sorted by key and by weight within a key.
+    '''
+    entries = sorted(entries, key=lambda entry: (entry[0], -entry[2], entry[1]))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION, ENTRY.size, len(entries)))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+
+def read_book(path: str) -> list[BookEntry]:
+    with OpeningBook(path) as book:
+        return [ENTRY.unpack_from(book.data, HEADER.size + i * ENTRY.size) for i in range(len(book))]
+
+class OpeningBook:
+    '''
+    Read-only opening book. The file is memory-mapped and positions are found with a
+    binary search on the key, so opening it costs nothing and only the pages that are
+    probed are read from disk.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:      # Empty file
+            self.file.close()
+            raise ValueError(f"Invalid opening book: {path}")
+
+        self.num_entries = 0
+        if len(self.data) >= HEADER.size:
+            magic, version, entry_size, self.num_entries = HEADER.unpack_from(self.data, 0)
+        if len(self.data) < HEADER.size or magic != BOOK_MAGIC or version != BOOK_VERSION or entry_size != ENTRY.size or len(self.data) < HEADER.size + self.num_entries * ENTRY.size:
+            self.close()
+            raise ValueError(f"Invalid opening book: {path}")
+
+    @classmethod
+    def load(cls, path: str) -> OpeningBook | None:
+        '''
+        Open a book, or return None if there is no valid book at path.
+        '''
+        try:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            if os.path.exists(path):
+                print(f"Opening book error: {e}")
+            return None
+
+    def key_at(self, index: int) -> int:
+        return ENTRY.unpack_from(self.data, HEADER.size + index * ENTRY.size)[0]
+
+    def probe(self, key: int) -> list[tuple[int, int, int]]:
+        '''
+        Find the moves stored for a position.
+
+        Returns:
+            list[tuple[int, int, int]]: (packed move, weight, score) of every entry of the key, highest weight first.
+        '''
+        low, high = 0, self.num_entries
+        while low < high:
+            mid = (low + high) // 2
+            if self.key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        moves = []
+        offset = HEADER.size + low * ENTRY.size
+        while low < self.num_entries:
+            entry_key, move, weight, score = ENTRY.unpack_from(self.data, offset)
+            if entry_key != key:
+                break
+            moves.append((move, weight, score))
+            low += 1
+            offset += ENTRY.size
+        return moves
+
+    def choose(self, board: BitBoard, rng: random.Random = None) -> int | None:
+        '''
+        Pick a book move for the position, at random by weight if a generator is given,
+        otherwise the one with the highest weight. Moves that are not legal on the board
+        (a hash collision or a book of another variant) are ignored.
+
+        Returns:
+            int | None: The packed move, or None if the position is not in the book.
+        '''
+        moves = self.probe(board.hash)
+        if not moves:
+            return None
+
+        legal_moves = set(board.packed_moves())
+        moves = [(move, weight) for move, weight, _ in moves if move in legal_moves and weight > 0]
+        if not moves:
+            return None
+        if rng is None:
+            return moves[0][0]
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def close(self) -> None:
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+    def __len__(self) -> int:
+        return self.num_entries
+
+    def __enter__(self) -> OpeningBook:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -1,118 +1,120 @@
-from scripts.board import Board
-from scripts.move import Move
+from scripts.bitboard import BitBoard, MAX_SEARCH_PLY
+from scripts.move import Move, MOVE_SQUARE_BITS, MOVE_SQUARE_MASK, move_from_packed
+from scripts.transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+from scripts.ordering import MoveOrderer
+from scripts.evaluation import MATE_SCORE, KING_MOBILITY_WEIGHT, ATTACKER_PROXIMITY_WEIGHT
+from scripts.batch_eval import child_arrays, evaluate_batch
+from scripts.book import OpeningBook
+from scripts.tablebase import Tablebase, WIN, LOSS
+from scripts.timeman import TimeManager
 from scripts.constants import KING, ROOK, BLACK, WHITE, DEBUG
 
-import time
 import random
-from typing import Literal
+import numpy as np
+from typing import Callable
 
 INF = float('inf')
 MAX_DEPTH = 10
-MAX_TIME_PER_MOVE = 5
-MATE_SCORE = 10_000
-
-VALUES = {
-    WHITE: 180,
-    BLACK: 100
-}
-
-PST = {
-    WHITE: {
-        ROOK: [
-            [0, 50, 50, 50, 50, 50, 50, 50, 0],
-            [50, 40, 20, 20, 20, 20, 20, 40, 50],
-            [50, 20, 10, 10, 10, 10, 10, 20, 50],
-            [50, 20, 0, 0, 0, 0, 0, 20, 50],
-            [50, 20, 0, 0, 0, 0, 0, 20, 50],
-            [50, 20, 0, 0, 0, 0, 0, 20, 50],
-            [50, 20, 10, 10, 10, 10, 10, 20, 50],
-            [50, 40, 20, 20, 20, 20, 20, 40, 50],
-            [0, 50, 50, 50, 50, 50, 50, 50, 0]
-        ],
-        KING: [
-            [MATE_SCORE, 1000, 200, 200, 200, 200, 200, 1000, MATE_SCORE],
-            [1000, 50, 0, 0, 0, 0, 0, 50, 1000],
-            [200, 0, 0, 0, 0, 0, 0, 0, 200],
-            [200, 0, 0, 0, 0, 0, 0, 0, 200],
-            [200, 0, 0, 0, 0, 0, 0, 0, 200],
-            [200, 0, 0, 0, 0, 0, 0, 0, 200],
-            [200, 0, 0, 0, 0, 0, 0, 0, 200],
-            [1000, 50, 0, 0, 0, 0, 0, 50, 1000],
-            [MATE_SCORE, 1000, 200, 200, 200, 200, 200, 1000, MATE_SCORE]
-        ]
-    },
-    BLACK: {
-        ROOK: [
-            [0, 0, 40, 0, 0, 0, 40, 0, 0],
-            [0, 40, 10, 10, 10, 10, 10, 40, 0],
-            [40, 10, 20, 20, 20, 20, 20, 10, 40],
-            [0, 10, 20, 30, 30, 30, 20, 10, 0],
-            [0, 10, 20, 30, 0, 30, 20, 10, 0],
-            [0, 10, 20, 30, 30, 30, 20, 10, 0],
-            [40, 10, 20, 20, 20, 20, 20, 10, 40],
-            [0, 40, 10, 10, 10, 10, 10, 40, 0],
-            [0, 0, 40, 0, 0, 0, 40, 0, 0]
-        ]
-    }
-}
-
-def generate_moves(board: Board) -> list[Move]:
-    moves = []
-    for piece in board.board:
-        if piece is None or piece.color != board.turn:
-            continue
-        piece_moves = [Move(piece.row, piece.col, row, col) for row, col in piece.legal_moves()]
-        moves.extend(piece_moves)
-    return moves
-
-def generate_interesting_moves(board: Board) -> list[Move]:
+MAX_TIME_PER_MOVE = 5      # Without a game clock
+BOT_CLOCK = None           # Seconds on the game clock of the bot in AI mode, None plays MAX_TIME_PER_MOVE per move
+BOT_INCREMENT = 0          # Seconds added to that clock after every move
+TIME_CHECK_NODES = 512     # Nodes searched between two checks of the clock and of abort_check
+TT_SIZE_MB = 16
+SEARCH_PROCESSES = 1    # More than 1 plays with a Lazy SMP ParallelBot
+OPENING_BOOK_PATH = "assets/book/opening_book.bin"     # Written by make_book.py, the bot searches every move without it
+TABLEBASE_PATH = "assets/tablebase/9x9.tb"             # Written by make_tablebase.py, endgames are searched without it
+PONDER = True              # Search the predicted reply while the opponent thinks
+
+# Score of a repeated position, by rule variant
+REPETITION_DRAW = 0        # The game is drawn
+REPETITION_LOSS = 1        # The side that repeats the position loses, as in the Copenhagen rules
+REPETITION_RULE = REPETITION_DRAW
+ASPIRATION_WINDOW = 50
+BATCH_ORDER_DEPTH = 3      # Nodes with at least this depth left also order the moves by a batched static evaluation of the children
+QUIESCE_BATCH_MOVES = 6    # Quiescence nodes with at least this many moves score the children in one batch
+QUIESCE_DELTA_MARGIN = 200 # and skip the ones whose static evaluation stays this far below alpha
+
+# Selective search, each part can be switched off on a Bot
+NULL_MOVE_PRUNING = True
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+LATE_MOVE_REDUCTIONS = True
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVE = 4           # The first moves of a node are never reduced
+FUTILITY_PRUNING = True
+FUTILITY_MARGIN = 150
+
+def generate_moves(board: BitBoard, moves: list[int] = None) -> list[int]:
+    return board.packed_moves(moves=moves)
+
+def generate_interesting_moves(board: BitBoard, moves: list[int] = None) -> list[int]:
     '''
     Generate all the interesting moves for the current player.
     An interesting move is a move that captures an enemy piece or puts the king on the edge of the board.
     
     Parameters:
-        board (Board): The current board.
+        board (BitBoard): The current board.
+        moves (list[int]): A list to reuse for the moves.
 
     Returns:
-        list[Move]: A list of all the interesting moves for the current player.
+        list[int]: A list of all the interesting moves for the current player, packed.
     '''
-    moves = []
-    for piece in board.board:
-        if piece is None or piece.color != board.turn:
-            continue
-        for row, col in piece.legal_moves():
-            move = Move(piece.row, piece.col, row, col)
-            if board.move_is_capture(move):
-                moves.append(move)
-            elif piece.type == KING and board.move_is_to_edge(move):
-                moves.append(move)
-    return moves
+    return board.packed_interesting_moves(moves)
 
 
 class Bot():
-    def __init__(self, size: int, color: int) -> None:
-        self.board = Board(size, size)
+    def __init__(self, size: int, color: int, transposition_table: TranspositionTable = None, ordering_seed: int = None) -> None:
+        self.board = BitBoard(size, size)
         self.color = color
 
-        self.transposition_table = {}
-        self.board_states = {}
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable(TT_SIZE_MB)
+        self.move_orderer = MoveOrderer(ordering_seed)
+
+        # Hooks for parallel search helpers
+        self.depth_offset = 0
+        self.abort_check: Callable[[], bool] = None
+        self.iteration_callback: Callable[[int, int, Move], None] = None
+
+        self.repetition_rule = REPETITION_RULE
+        self.search_start = 0   # Length of the hash stack of the board at the root of the search
+
+        self.max_depth = MAX_DEPTH
+        self.max_time = MAX_TIME_PER_MOVE
+
+        # Game clock of the bot, the time per move is max_time if there is none
+        self.clock: float = None
+        self.increment = 0
+        self.moves_to_go: int = None
+        self.time_manager = TimeManager()
+        self.stopped = False
+        self.nodes_to_check = TIME_CHECK_NODES
+
+        self.opening_book = OpeningBook.load(OPENING_BOOK_PATH)
+        self.use_opening_book = True
+        self.book_rng = random.Random()
+
+        self.tablebase = Tablebase.load(TABLEBASE_PATH)
+        self.use_tablebase = True
+
+        # Pondering: the search has no time limit until the opponent plays the predicted reply
+        self.pondering = False
+
+        self.null_move_pruning = NULL_MOVE_PRUNING
+        self.late_move_reductions = LATE_MOVE_REDUCTIONS
+        self.futility_pruning = FUTILITY_PRUNING
+
+        # The search plays packed moves with make_move, the move lists of each ply of the search path are reused
+        self.move_lists: list[list[int]] = [[] for _ in range(MAX_SEARCH_PLY)]
 
         self.numpos = 0
-        self.start_time = 0
         self.cur_max_depth = 0
     
-    def order_moves(self, moves: list[Move]) -> list[Move]:
-        capture_moves = []
-        non_capture_moves = []
-        king_on_edge_moves = []
-        for move in moves:
-            if self.board.move_is_capture(move):
-                capture_moves.append(move)
-            elif self.board.move_is_to_edge(move):
-                king_on_edge_moves.append(move)
-            else:
-                non_capture_moves.append(move)
-        return king_on_edge_moves + capture_moves + non_capture_moves
+    def order_moves(self, moves: list[int], tt_move: int = 0, ply: int = 0, depth: int = 0) -> list[int]:
+        if depth >= BATCH_ORDER_DEPTH and len(moves) > 1:
+            # The move orderer sort is stable, so the static evaluation breaks its ties
+            scores = evaluate_batch(child_arrays(self.board, moves), self.board.turn)
+            moves[:] = [moves[i] for i in np.argsort(-scores, kind='stable')]
+        return self.move_orderer.order(self.board, moves, tt_move, ply)
     
     def distance_to_center(self, row: int, col: int) -> int:
         return abs(row - self.board.height // 2) + abs(col - self.board.width // 2)
@@ -125,33 +127,32 @@ class Bot():
         return False
     
     def evaluate(self) -> int:
+        '''
+        Evaluate the position from the point of view of the side to move. Material and
+        piece-square terms are kept up to date by the board, only the king's mobility
+        and the attackers next to it are computed here.
+        '''
         self.numpos += 1
-        score = 0
-        for piece in self.board.board:
-            if piece is None:
-                continue
-
-            multiplier = 1 if piece.color == self.board.turn else -1
-            score += VALUES[piece.color] * multiplier
-            # score += PST[piece.color][piece.type][piece.row][piece.col] * multiplier
+        board = self.board
+        score = board.piece_score
 
-            if piece.type == KING:
-                # add distance to center to encourage king to move to the corners
-                score += PST[piece.color][KING][piece.row][piece.col] * multiplier
+        if board.king:
+            king_sq = board.king.bit_length() - 1
+            # add king moves to encourage king to move
+            score += board.piece_moves(king_sq).bit_count() * KING_MOBILITY_WEIGHT
+            # attackers closing in on the king
+            score -= (board.geometry.neighbours[king_sq] & board.attackers).bit_count() * ATTACKER_PROXIMITY_WEIGHT
 
-                # add king moves to encourage king to move
-                king_moves = len(piece.legal_moves())
-                score += king_moves * 20 * multiplier
-
-                # add king access to edge to encourage defending team to restrict king's movement to the edge
-                
-
-        return score
+        return score if board.turn == WHITE else -score
     
     def quiesce(self, alpha: int, beta: int, q_depth: int = 3) -> int:
         if self.board.winner is not None:
-            mate_score = MATE_SCORE - (self.cur_max_depth + q_depth)
+            mate_score = MATE_SCORE - self.board.ply
             return mate_score if self.board.winner == self.board.turn else -mate_score
+
+        tablebase_score = self.probe_tablebase(self.board.ply)
+        if tablebase_score is not None:
+            return tablebase_score
         
         stand_pat = self.evaluate()
 
@@ -164,11 +165,17 @@ class Bot():
         if alpha < stand_pat:
             alpha = stand_pat
         
-        legal_moves = generate_interesting_moves(self.board)
+        legal_moves = generate_interesting_moves(self.board, self.move_lists[self.board.ply])
+        if len(legal_moves) >= QUIESCE_BATCH_MOVES:
+            # Score all the children at once, best first, and skip those that cannot raise alpha.
+            # Children that end the game score +-MATE_SCORE and are always searched
+            scores = evaluate_batch(child_arrays(self.board, legal_moves), self.board.turn)
+            order = np.argsort(-scores, kind='stable')
+            legal_moves[:] = [legal_moves[i] for i in order if scores[i] + QUIESCE_DELTA_MARGIN > alpha or abs(scores[i]) >= MATE_SCORE]
         for move in legal_moves:
-            self.board.move_piece_by_move(move)
+            self.board.make_move(move)
             score = -self.quiesce(-beta, -alpha, q_depth - 1)
-            self.board.undo_move()
+            self.board.unmake_move()
 
             if score >= beta:
                 return score
@@ -178,11 +185,11 @@ class Bot():
                 alpha = score
         return best_score
     
-    def store_transposition(self, depth: int, value: int, node_type: Literal["exact", "lower_bound", "upper_bound"]) -> None:
+    def store_transposition(self, depth: int, value: int, node_type: int, best_move: int = 0) -> None:
         if self.is_mate_score(value):
             sign = 1 if value > 0 else -1
-            value = value + ((self.cur_max_depth - depth) * sign)
-        self.transposition_table[hash(self.board)] = {'depth': depth, 'value': value, 'type': node_type}
+            value = value + (self.board.ply * sign)     # Stored as the distance from this node
+        self.transposition_table.store(self.board.hash, depth, node_type, value, best_move)
     
     def is_mate_score(self, score: int) -> bool:
         return abs(score) >= MATE_SCORE - 100
@@ -196,81 +203,199 @@ class Bot():
             score = score - (ply * sign)
         return score
 
-    def negamax(self, depth: int, alpha: int, beta: int) -> int:
-        if time.time() - self.start_time > MAX_TIME_PER_MOVE:
+    def probe_tablebase(self, ply: int) -> int:
+        '''
+        Exact score of the position from the endgame tablebase, with wins and losses scored
+        like the mates found by the search.
+
+        Returns:
+            int: The score for the side to move, or None if the position is not in the tablebase.
+        '''
+        if not self.use_tablebase or self.tablebase is None:
             return None
-        
-        board_hash = hash(self.board)
-        num_occurrences = self.board_states.get(board_hash, 0)
-        if num_occurrences >= 5:
-            return -INF if self.board.turn == self.color else INF
-        self.board_states[board_hash] = num_occurrences + 1
-        
+        entry = self.tablebase.probe(self.board)
+        if entry is None:
+            return None
+        result, distance = entry
+        if result == WIN:
+            return MATE_SCORE - (ply + distance)
+        if result == LOSS:
+            return -(MATE_SCORE - (ply + distance))
+        return 0
+
+    def out_of_time(self) -> bool:
+        '''
+        Check the hard time limit and abort_check. Once the search is stopped it stays stopped.
+        '''
+        if self.stopped:
+            return True
+        if self.abort_check is not None and self.abort_check():
+            self.stopped = True
+        elif not self.pondering and self.time_manager.hard_limit_reached():
+            self.stopped = True
+        return self.stopped
+
+    def null_move_allowed(self) -> bool:
+        '''
+        Passing is a good guess of a lower bound only if the side to move is not in a zugzwang-like
+        position: the king on the edge or boxed in by attackers, or a side with very few pieces left,
+        where any move can be the losing one.
+        '''
+        board = self.board
+        if board.king:
+            king_sq = board.king.bit_length() - 1
+            if board.geometry.edge_mask >> king_sq & 1:
+                return False
+            if (board.geometry.neighbours[king_sq] & board.attackers).bit_count() >= 2:
+                return False
+        return board.side_mask(board.turn).bit_count() > 3
+
+    def negamax(self, depth: int, alpha: int, beta: int, allow_null: bool = True) -> int:
+        if self.stopped:
+            return None
+        self.nodes_to_check -= 1
+        if self.nodes_to_check == 0:
+            self.nodes_to_check = TIME_CHECK_NODES
+            if self.out_of_time():
+                return None
+
+        if self.board.is_repetition(self.search_start):
+            if self.repetition_rule == REPETITION_LOSS:
+                return MATE_SCORE - self.board.ply    # The opponent just repeated the position
+            return 0
+
+        return self.alpha_beta(depth, alpha, beta, self.board.hash, allow_null)
+
+    def alpha_beta(self, depth: int, alpha: int, beta: int, board_hash: int, allow_null: bool = True) -> int:
         alpha_orig = alpha
 
         if self.board.winner is not None:
-            mate_score = MATE_SCORE - (self.cur_max_depth - depth)
+            mate_score = MATE_SCORE - self.board.ply
             return mate_score if self.board.winner == self.board.turn else -mate_score
-        
-        transposition_entry = self.transposition_table.get(hash(self.board), None)
-        if transposition_entry is not None and transposition_entry['depth'] >= depth:
-            corrected_value = self.correct_mate_score(transposition_entry['value'], self.cur_max_depth - depth)
-            if transposition_entry['type'] == "exact":
-                return corrected_value
-            if transposition_entry['type'] == "lower_bound":
-                alpha = max(alpha, corrected_value)
-            if transposition_entry['type'] == "upper_bound":
-                beta = min(beta, corrected_value)
 
-            if alpha >= beta:
-                return corrected_value
+        tablebase_score = self.probe_tablebase(self.board.ply)
+        if tablebase_score is not None:
+            return tablebase_score
+        
+        tt_move = 0
+        transposition_entry = self.transposition_table.probe(board_hash)
+        if transposition_entry is not None:
+            tt_depth, tt_type, tt_value, tt_move = transposition_entry
+            if tt_depth >= depth:
+                corrected_value = self.correct_mate_score(tt_value, self.board.ply)
+                if tt_type == EXACT:
+                    return corrected_value
+                if tt_type == LOWER_BOUND:
+                    alpha = max(alpha, corrected_value)
+                if tt_type == UPPER_BOUND:
+                    beta = min(beta, corrected_value)
+
+                if alpha >= beta:
+                    return corrected_value
         
         if depth == 0:
             return self.quiesce(alpha, beta)
         
-        legal_moves = generate_moves(self.board)
-        legal_moves = self.order_moves(legal_moves)
+        board = self.board
+        pv_node = beta - alpha > 1
+        static_eval = None
+
+        # Null move: if passing still fails high at a reduced depth, a real move would too
+        if self.null_move_pruning and allow_null and not pv_node and depth >= NULL_MOVE_MIN_DEPTH and not self.is_mate_score(beta) and self.null_move_allowed():
+            static_eval = self.evaluate()
+            if static_eval >= beta:
+                board.make_null_move()
+                eval = self.negamax(max(0, depth - 1 - NULL_MOVE_REDUCTION), -beta, -beta + 1, allow_null=False)
+                board.undo_null_move()
+                if eval is None:    # time limit reached
+                    return None
+                if -eval >= beta:
+                    return beta
+
+        # Futility: at frontier nodes far below alpha only the moves that capture or move the king can help
+        futile = False
+        if self.futility_pruning and depth == 1 and not pv_node and not self.is_mate_score(alpha):
+            if static_eval is None:
+                static_eval = self.evaluate()
+            futile = static_eval + FUTILITY_MARGIN <= alpha
+
+        selective = futile or (self.late_move_reductions and depth >= LMR_MIN_DEPTH and not pv_node)
+        if selective:
+            capture_targets = board.capture_targets(board.turn)
+
+        ply = board.ply     # Distance from the root, reductions make it differ from cur_max_depth - depth
+        legal_moves = generate_moves(board, self.move_lists[ply])
+        legal_moves = self.order_moves(legal_moves, tt_move, ply, depth)
         
         best_move_value = -INF
-        for move in legal_moves:
-            self.board.move_piece_by_move(move)
-            eval = self.negamax(depth - 1, -beta, -alpha)
-            self.board.undo_move()
+        best_move = 0
+        for i, move in enumerate(legal_moves):
+            quiet = False
+            if selective and i > 0:
+                quiet = not (capture_targets >> (move >> MOVE_SQUARE_BITS) & 1 or board.king >> (move & MOVE_SQUARE_MASK) & 1)
+            if futile and quiet:
+                best_move_value = max(best_move_value, static_eval + FUTILITY_MARGIN)
+                continue
+
+            board.make_move(move)
+            if quiet and i >= LMR_MIN_MOVE and depth >= LMR_MIN_DEPTH:
+                # Late quiet moves are searched one ply shallower first, and again at full depth if they beat alpha
+                eval = self.negamax(depth - 2, -alpha - 1, -alpha)
+                if eval is not None and -eval > alpha:
+                    eval = self.search_child(depth - 1, alpha, beta, False)
+            else:
+                eval = self.search_child(depth - 1, alpha, beta, i == 0)
+            board.unmake_move()
 
             if eval is None:    # time limit reached
                 return None
             eval = -eval
 
-            best_move_value = max(best_move_value, eval)
+            if eval > best_move_value:
+                best_move_value = eval
+                best_move = move
             alpha = max(alpha, eval)
             if alpha >= beta:
+                self.move_orderer.record_cutoff(self.board, move, ply, depth, i)
                 break
 
-        node_type = "exact"
+        node_type = EXACT
         if best_move_value <= alpha_orig:
-            node_type = "upper_bound"
+            node_type = UPPER_BOUND
         elif best_move_value >= beta:
-            node_type = "lower_bound"
-        self.store_transposition(depth, best_move_value, node_type)
+            node_type = LOWER_BOUND
+        self.store_transposition(depth, best_move_value, node_type, best_move)
         
         return best_move_value
 
-    def root_move(self, depth: int, ex_best_move: Move) -> tuple[int, Move]:
+    def search_child(self, depth: int, alpha: int, beta: int, first_move: bool) -> int:
+        '''
+        Principal variation search of the position after a move, from the point of view of the child.
+        The first move is searched with the full window, the others with a null window
+        and searched again only if they turn out to be better than the current best move.
+        '''
+        if first_move or alpha == -INF or alpha + 1 >= beta:
+            return self.negamax(depth, -beta, -alpha)
+
+        eval = self.negamax(depth, -alpha - 1, -alpha)
+        if eval is not None and alpha < -eval < beta:
+            eval = self.negamax(depth, -beta, -alpha)
+        return eval
+
+    def root_move(self, depth: int, ex_best_move: int, alpha: int = -INF, beta: int = INF) -> tuple[int, int]:
         best_eval = -INF
         best_move = None
-        alpha = -INF
-        beta = INF
 
         legal_moves = generate_moves(self.board)
-        legal_moves = self.order_moves(legal_moves)
+        legal_moves = self.order_moves(legal_moves, depth=depth)
         if ex_best_move is not None:
             legal_moves.remove(ex_best_move)
             legal_moves.insert(0, ex_best_move)
     
-        for move in legal_moves:
-            self.board.move_piece_by_move(move)
-            eval = self.negamax(depth - 1, -beta, -alpha)
-            self.board.undo_move()
+        for i, move in enumerate(legal_moves):
+            self.board.make_move(move)
+            eval = self.search_child(depth - 1, alpha, beta, i == 0)
+            self.board.unmake_move()
 
             if eval is None:    # time limit reached
                 return best_eval, best_move
@@ -285,28 +410,162 @@ class Bot():
 
         return best_eval, best_move
     
-    def get_move(self) -> Move:
+    def aspiration_search(self, depth: int, ex_best_move: int, ex_eval: int) -> tuple[int, int, bool]:
+        '''
+        Search the root with a window centered on the score of the previous iteration,
+        widening it and searching again on a fail high or fail low.
+
+        Returns:
+            tuple[int, int, bool]: The evaluation, the packed best move and whether the search
+            ran out of time while failing low, in which case the move should not be trusted.
+        '''
+        if ex_eval is None or abs(ex_eval) == INF or self.is_mate_score(ex_eval):
+            eval, move = self.root_move(depth, ex_best_move)
+            return eval, move, False
+
+        delta = ASPIRATION_WINDOW
+        alpha, beta = ex_eval - delta, ex_eval + delta
+        while True:
+            eval, move = self.root_move(depth, ex_best_move, alpha, beta)
+            if move is None:
+                return eval, move, False
+
+            out_of_time = self.out_of_time()
+            if eval <= alpha and alpha != -INF:
+                if out_of_time:
+                    return eval, move, True
+                delta *= 4
+                alpha = ex_eval - delta if delta < MATE_SCORE else -INF
+            elif eval >= beta and beta != INF:
+                if out_of_time:
+                    return eval, move, False
+                ex_best_move = move
+                delta *= 4
+                beta = ex_eval + delta if delta < MATE_SCORE else INF
+            else:
+                return eval, move, False
+
+            if DEBUG:
+                print(f"Aspiration re-search at depth {depth}: ({alpha}, {beta})")
+
+    def close(self) -> None:
+        if self.opening_book is not None:
+            self.opening_book.close()
+            self.opening_book = None
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
+
+    def book_move(self) -> Move:
+        '''
+        Returns the opening book move of the position, or None if it is not in the book.
+        '''
+        if not self.use_opening_book or self.opening_book is None or self.board.winner is not None:
+            return None
+        move = self.opening_book.choose(self.board, self.book_rng)
+        if move is None:
+            return None
+        if DEBUG:
+            print(f"Book move: {move_from_packed(move, self.board.width, self.board.height)}")
+        return move_from_packed(move, self.board.width, self.board.height)
+
+    def predicted_reply(self) -> int:
+        '''
+        Returns the packed move the opponent is expected to play in the current position,
+        the best move stored by the last search, or 0 if there is none.
+        '''
+        if self.board.winner is not None:
+            return 0
+        entry = self.transposition_table.probe(self.board.hash)
+        if entry is None or entry[3] not in generate_moves(self.board):
+            return 0
+        return entry[3]
+
+    def ponder(self, reply: int) -> Move:
+        '''
+        Play the predicted reply of the opponent on the board and search the position on the
+        opponent's time, until abort_check stops the search or ponder_hit turns it into a
+        normal search. The reply stays on the board.
+
+        Parameters:
+            reply (int): The packed move the opponent is expected to play.
+
+        Returns:
+            Move: The best move found, only meaningful if the opponent played the reply.
+        '''
+        self.board.move_piece_by_move(move_from_packed(reply, self.board.width, self.board.height))
+        if self.board.winner is not None:
+            return None
+        self.pondering = True
+        try:
+            return self.search()
+        finally:
+            self.pondering = False
+
+    def ponder_hit(self) -> None:
+        '''
+        The opponent played the predicted reply: the ponder search becomes the search of the
+        move, as if it had started when pondering did. If the time is already used up it
+        stops and returns its deepest completed iteration.
+        '''
+        self.pondering = False
+
+    def use_time(self, elapsed: float) -> None:
+        '''
+        Take the time spent on a move off the game clock and add the increment.
+
+        Parameters:
+            elapsed (float): The seconds the move took, from the start of the search to playing it.
+        '''
+        if self.clock is not None:
+            self.clock = max(0.0, self.clock - elapsed) + self.increment
+
+    def get_move(self, start_time: float = None) -> Move:
+        book_move = self.book_move()
+        if book_move is not None:
+            return book_move
+
         if self.board.list_of_moves == []:
             legal_moves = generate_moves(self.board)
-            return random.choice(legal_moves)
+            return move_from_packed(random.choice(legal_moves), self.board.width, self.board.height)
+
+        return self.search(start_time)
 
-        self.start_time = time.time()
+    def search(self, start_time: float = None) -> Move:
+        '''
+        Iterative deepening search of the current position until the time or the depth limit.
+
+        Parameters:
+            start_time (float): The time.monotonic() time the move started at, now by default.
+        '''
+        self.time_manager.start(self.max_time, self.clock, self.increment, self.moves_to_go, start_time)
+        self.stopped = False
+        self.nodes_to_check = TIME_CHECK_NODES
+        self.search_start = len(self.board.hash_stack)
         best_move = None
+        best_eval = None
         self.numpos = 0
-        for cur_depth in range(1, MAX_DEPTH + 1):
+        self.transposition_table.new_search()
+        self.transposition_table.reset_stats()
+        self.move_orderer.new_search()
+        for cur_depth in range(1 + self.depth_offset, self.max_depth + 1):
             self.cur_max_depth = cur_depth
-            if time.time() - self.start_time > MAX_TIME_PER_MOVE:
+            if self.out_of_time():
                 break
-            eval, move = self.root_move(cur_depth, best_move)
+            eval, move, failed_low = self.aspiration_search(cur_depth, best_move, best_eval)
 
             if DEBUG:
-                print(f"Depth: {cur_depth}, Eval: {eval}, Move: {move}, Numpos: {self.numpos}")
-            if move is not None:
+                print(f"Depth: {cur_depth}, Eval: {eval}, Move: {move_from_packed(move, self.board.width, self.board.height) if move is not None else None}, Numpos: {self.numpos}, TT: {self.transposition_table.stats()}, First move cutoffs: {self.move_orderer.first_move_cutoff_rate():.2f}")
+            if move is not None and not failed_low:
                 best_eval, best_move = eval, move
+                if self.iteration_callback is not None and not self.out_of_time():
+                    self.iteration_callback(cur_depth, best_eval, move_from_packed(best_move, self.board.width, self.board.height))
             else:
                 break
 
             if self.is_mate_score(best_eval):
                 break
+            if self.time_manager.iteration_done(best_move, best_eval) and not self.pondering:
+                break
 
-        return best_move
+        return move_from_packed(best_move, self.board.width, self.board.height) if best_move is not None else None
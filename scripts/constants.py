@@ -23,5 +23,7 @@ SERVER = "151.16.174.60"
 ENCODER = "utf-8"
 END_CONNECTION = "!END!"
 MESSAGE_LENGTH = 4
+RECONNECT_GRACE = 60    # Seconds a game waits for a dropped player to come back
+RECONNECT_DELAY = 1     # Seconds between the attempts of a client to reconnect
 
 DEBUG = False
\ No newline at end of file
@@ -0,0 +1,83 @@
+from array import array
+
+from scripts.constants import WHITE, BLACK
+from scripts.board import ATTACKER, DEFENDER, KING_KIND
+
+MATE_SCORE = 10_000
+
+VALUES = {
+    WHITE: 180,
+    BLACK: 100
+}
+
+KING_MOBILITY_WEIGHT = 20           # per square the king can move to
+ATTACKER_PROXIMITY_WEIGHT = 30      # per attacker next to the king
+
+_TABLES: dict[tuple[int, int], list[array]] = {}
+
+def edge_distance(row: int, col: int, width: int, height: int) -> int:
+    return min(row, col, height - 1 - row, width - 1 - col)
+
+def corner_distance(row: int, col: int, width: int, height: int) -> int:
+    '''
+    Manhattan distance to the nearest corner.
+    '''
+    return min(row, height - 1 - row) + min(col, width - 1 - col)
+
+def king_square_value(row: int, col: int, width: int, height: int) -> int:
+    # Encourage the king to move to the corners: the edge, and above all the squares next to a corner
+    distance = edge_distance(row, col, width, height)
+    to_corner = corner_distance(row, col, width, height)
+    if to_corner == 0:
+        return MATE_SCORE
+    if distance == 0:
+        return 1000 if to_corner == 1 else 200
+    if distance == 1 and to_corner == 2:
+        return 50
+    return 0
+
+def defender_square_value(row: int, col: int, width: int, height: int) -> int:
+    # Defenders on the edges and next to the corners open the way for the king
+    distance = edge_distance(row, col, width, height)
+    to_corner = corner_distance(row, col, width, height)
+    if to_corner == 0:
+        return 0
+    if distance == 0:
+        return 50
+    if distance == 1:
+        return 40 if to_corner == 2 else 20
+    if distance == 2:
+        return 10
+    return 0
+
+def attacker_square_value(row: int, col: int, width: int, height: int) -> int:
+    # Attackers guard the corners from the squares diagonal to them and two squares away on the edges,
+    # and otherwise close in on the center
+    distance = edge_distance(row, col, width, height)
+    to_corner = corner_distance(row, col, width, height)
+    if to_corner == 2 and distance <= 1:
+        return 40
+    if (row, col) == (height // 2, width // 2):
+        return 0
+    return [0, 10, 20][distance] if distance < 3 else 30
+
+def piece_square_tables(width: int, height: int) -> list[array]:
+    '''
+    Piece-square tables of a board size, material included, indexed by piece kind
+    and square (row * width + col). Scores are from the point of view of white.
+    The tables are built once per size.
+
+    Returns:
+        list[array]: One flat array per piece kind (ATTACKER, DEFENDER, KING_KIND).
+    '''
+    tables = _TABLES.get((width, height))
+    if tables is None:
+        tables = [array('i', bytes(4 * width * height)) for _ in range(3)]
+        for row in range(height):
+            for col in range(width):
+                sq = row * width + col
+                tables[ATTACKER][sq] = -(VALUES[BLACK] + attacker_square_value(row, col, width, height))
+                tables[DEFENDER][sq] = VALUES[WHITE] + defender_square_value(row, col, width, height)
+                tables[KING_KIND][sq] = VALUES[WHITE] + king_square_value(row, col, width, height)
+        _TABLES[(width, height)] = tables
+    return tables
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import zlib
+from array import array
+from struct import Struct
+
+from scripts.constants import ENCODER
+
+# The game log is a directory of segment files holding fixed-size records, in the order
+# the server accepted them. A record is the game id, the ply of the move, the kind of
+# record, four small fields and a 16 byte text (a player name), followed by the CRC32 of
+# all that so a torn write at the end of the last segment is detected and cut off.
+SEGMENT_PREFIX = "segment_"
+SEGMENT_SUFFIX = ".log"
+SEGMENT_RECORDS = 1 << 16      # Records per segment file (2 MB)
+
+RECORD_BODY = Struct('<IHBBBB16sxx')    # game id, ply, kind, a, b, c, text
+RECORD_CRC = Struct('<I')
+RECORD_SIZE = RECORD_BODY.size + RECORD_CRC.size
+
+# Record kinds and the meaning of their fields
+START = 1       # a: board size
+PLAYER = 2      # a: color, text: name
+MOVE = 3        # ply: number of moves before it, a: from square, b: to square (row * size + col)
+END = 4         # a: winner, NO_WINNER if the game was abandoned
+SESSION = 5     # a: color, text: session token of the player
+
+NO_WINNER = 255
+
+# Records are written to the file as they come, so they survive a crash of the server, and
+# flushed to the disk in batches: at most FSYNC_INTERVAL seconds or FSYNC_RECORDS records late
+FSYNC_INTERVAL = 0.05
+FSYNC_RECORDS = 256
+
+LOCATION_SHIFT = 32     # An index location is the segment number << 32 | the record number in the segment
+
+Record = tuple[int, int, int, int, int, int, str]   # (game id, ply, kind, a, b, c, text)
+
+def encode_record(game_id: int, ply: int, kind: int, a: int = 0, b: int = 0, c: int = 0, text: str = "") -> bytes:
+    body = RECORD_BODY.pack(game_id, ply, kind, a, b, c, text.encode(ENCODER))
+    return body + RECORD_CRC.pack(zlib.crc32(body))
+
+def decode_record(data: bytes, offset: int = 0) -> Record | None:
+    '''
+    Returns:
+        Record | None: The record at offset, or None if its checksum does not match.
+    '''
+    body = data[offset:offset + RECORD_BODY.size]
+    if RECORD_CRC.unpack_from(data, offset + RECORD_BODY.size)[0] != zlib.crc32(body):
+        return None
+    game_id, ply, kind, a, b, c, text = RECORD_BODY.unpack(body)
+    return game_id, ply, kind, a, b, c, text.rstrip(b"\0").decode(ENCODER, errors="ignore")
+
+class LoggedGame:
+    '''
+    State of a game rebuilt from the log.
+    '''
+    __slots__ = ('game_id', 'size', 'players', 'tokens', 'moves', 'winner')
+
+    def __init__(self, game_id: int, size: int):
+        self.game_id = game_id
+        self.size = size
+        self.players = ["", ""]     # Indexed by color
+        self.tokens: list[str] = [None, None]
+        self.moves: list[tuple[int, int]] = []     # (from square, to square)
+        self.winner: int = None
+
+class GameLog:
+    '''
+    Append-only log of the games of the server, so they can be rebuilt after a restart.
+
+    Every game has an id that is never reused and an index of the locations of its records,
+    so the records of one game are read without scanning the log.
+    '''
+    def __init__(self, directory: str, fsync_interval: float = FSYNC_INTERVAL, fsync_records: int = FSYNC_RECORDS):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.fsync_records = fsync_records
+
+        self.index: dict[int, array] = {}
+        self.active: dict[int, LoggedGame] = {}     # Games without an END record, filled by open
+        self.next_game_id = 0
+
+        self.segment = 0
+        self.segment_records = 0
+        self.fd: int = None
+        self.retired_fds: list[int] = []    # Full segments waiting for their last fsync
+        self.read_fds: dict[int, int] = {}
+
+        self.unsynced = 0
+        self.records_written = 0
+        self.fsyncs = 0
+        self.has_unsynced: asyncio.Event = None
+        self.batch_full: asyncio.Event = None
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}")
+
+    def open(self) -> list[LoggedGame]:
+        '''
+        Read the log, rebuild the index and open the last segment for writing.
+
+        Returns:
+            list[LoggedGame]: The games that were not over, by id.
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        segments = sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                          if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        for segment in segments:
+            path = self.segment_path(segment)
+            with open(path, "rb") as f:
+                data = f.read()
+            valid = len(data) - len(data) % RECORD_SIZE
+            for number, offset in enumerate(range(0, valid, RECORD_SIZE)):
+                record = decode_record(data, offset)
+                if record is None:
+                    valid = offset
+                    break
+                self.replay(record, segment << LOCATION_SHIFT | number)
+            if valid < len(data):
+                print(f"Game log: {path} is damaged after record {valid // RECORD_SIZE}, cutting it")
+                os.truncate(path, valid)
+
+        self.segment = segments[-1] if segments else 0
+        self.open_segment(self.segment)
+        return sorted(self.active.values(), key=lambda game: game.game_id)
+
+    def replay(self, record: Record, location: int) -> None:
+        game_id, ply, kind, a, b, c, text = record
+        self.index.setdefault(game_id, array('Q')).append(location)
+        self.next_game_id = max(self.next_game_id, game_id + 1)
+
+        if kind == START:
+            self.active[game_id] = LoggedGame(game_id, a)
+            return
+        game = self.active.get(game_id)
+        if game is None:
+            return
+        if kind == PLAYER:
+            game.players[a] = text
+        elif kind == SESSION:
+            game.tokens[a] = text
+        elif kind == MOVE and ply == len(game.moves):
+            game.moves.append((a, b))
+        elif kind == END:
+            game.winner = None if a == NO_WINNER else a
+            del self.active[game_id]
+
+    def open_segment(self, segment: int) -> None:
+        self.segment = segment
+        self.fd = os.open(self.segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.segment_records = os.fstat(self.fd).st_size // RECORD_SIZE
+
+    def append(self, game_id: int, ply: int, kind: int, a: int = 0, b: int = 0, c: int = 0, text: str = "") -> None:
+        if self.fd is None:
+            raise ValueError(f"Game log {self.directory} is closed")
+        if self.segment_records >= SEGMENT_RECORDS:
+            self.retired_fds.append(self.fd)
+            self.open_segment(self.segment + 1)
+        os.write(self.fd, encode_record(game_id, ply, kind, a, b, c, text))
+        self.index.setdefault(game_id, array('Q')).append(self.segment << LOCATION_SHIFT | self.segment_records)
+        self.segment_records += 1
+        self.records_written += 1
+
+        self.unsynced += 1
+        if self.has_unsynced is not None:
+            self.has_unsynced.set()
+            if self.unsynced >= self.fsync_records:
+                self.batch_full.set()
+
+    def start_game(self, size: int, players: list[str], tokens: list[str] = None) -> int:
+        '''
+        Parameters:
+            size (int): The board size.
+            players (list[str]): The names of the players, indexed by color.
+            tokens (list[str]): The session tokens of the players, so they can rejoin the game after a restart.
+
+        Returns:
+            int: The id of the new game.
+        '''
+        game_id = self.next_game_id
+        self.next_game_id += 1
+        self.append(game_id, 0, START, size)
+        for color, name in enumerate(players):
+            self.append(game_id, 0, PLAYER, color, text=name)
+        for color, token in enumerate(tokens or ()):
+            if token is not None:
+                self.append(game_id, 0, SESSION, color, text=token)
+        return game_id
+
+    def log_move(self, game_id: int, ply: int, from_sq: int, to_sq: int) -> None:
+        self.append(game_id, ply, MOVE, from_sq, to_sq)
+
+    def end_game(self, game_id: int, winner: int = None) -> None:
+        self.append(game_id, 0, END, NO_WINNER if winner is None else winner)
+
+    def records(self, game_id: int) -> list[Record]:
+        '''
+        Read all the records of a game through the index.
+        '''
+        records = []
+        for location in self.index.get(game_id, ()):
+            segment = location >> LOCATION_SHIFT
+            fd = self.read_fds.get(segment)
+            if fd is None:
+                fd = self.read_fds[segment] = os.open(self.segment_path(segment), os.O_RDONLY)
+            records.append(decode_record(os.pread(fd, RECORD_SIZE, (location & 0xFFFFFFFF) * RECORD_SIZE)))
+        return records
+
+    async def run(self) -> None:
+        '''
+        Flush the records to the disk in batches, for as long as the server runs.
+        '''
+        self.has_unsynced = asyncio.Event()
+        self.batch_full = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.has_unsynced.wait()
+            try:
+                await asyncio.wait_for(self.batch_full.wait(), self.fsync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.has_unsynced.clear()
+            self.batch_full.clear()
+
+            # The retired segments stay in retired_fds until they are closed, so that close()
+            # still syncs and closes them if the task is cancelled during an fsync
+            retired = list(self.retired_fds)
+            self.unsynced = 0
+            for fd in retired + [self.fd]:
+                await loop.run_in_executor(None, os.fsync, fd)
+            for fd in retired:
+                self.retired_fds.remove(fd)
+                os.close(fd)
+            self.fsyncs += 1
+
+    def close(self) -> None:
+        for fd in self.retired_fds + [self.fd]:
+            if fd is not None:
+                os.fsync(fd)
+                os.close(fd)
+        for fd in self.read_fds.values():
+            os.close(fd)
+        self.retired_fds = []
+        self.read_fds = {}
+        self.fd = None
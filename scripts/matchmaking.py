@@ -0,0 +1,109 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable
+if TYPE_CHECKING:
+    from server import Table
+
+from collections import OrderedDict
+
+RATING_BUCKET = 200     # Players are paired with the players of their rating bucket or the next ones
+
+Seek = tuple[int, str, int | None, str | None]     # (size, name, rating bucket, wanted opponent)
+
+class Matchmaker:
+    '''
+    The tables of the server and the players waiting for an opponent.
+
+    A player who finds nobody to play gets a new table, which waits in the queue of its size
+    and rating bucket and under the name of the player. Every lookup is a dictionary access,
+    so joining costs the same however many games are running. Board ids come from a counter
+    and are never given twice, even after the game is over.
+    '''
+    def __init__(self, new_table: Callable[[int, int], Table]):
+        '''
+        Parameters:
+            new_table (Callable[[int, int], Table]): Makes a table from a board id and a board size.
+        '''
+        self.new_table = new_table
+        self.next_id = 0
+        self.tables: dict[int, Table] = {}      # Board id -> table, for all the live tables
+
+        # (size, rating bucket) -> waiting tables in the order they were created, by board id
+        self.queues: dict[tuple[int, int | None], OrderedDict[int, Table]] = {}
+        self.by_name: dict[tuple[int, str], Table] = {}         # (size, name) -> waiting table of the player
+        self.challenges: dict[tuple[int, str], Table] = {}      # (size, name) -> waiting table of a player who asked for them
+        self.seeks: dict[int, Seek] = {}        # Board id -> what the player of a waiting table asked for
+
+    def new_id(self) -> int:
+        board_id = self.next_id
+        self.next_id += 1
+        return board_id
+
+    def add(self, table: Table) -> None:
+        self.tables[table.board_id] = table
+
+    def find_table(self, size: int, name: str, rating: int = None, opponent: str = None) -> tuple[Table, bool]:
+        '''
+        Pair a player with a waiting player, or make them a table to wait at.
+
+        Parameters:
+            size (int): The board size.
+            name (str): The name of the player.
+            rating (int): The rating of the player, unrated players are paired together.
+            opponent (str): Only play against the player of this name.
+
+        Returns:
+            tuple[Table, bool]: The table and True if the player was paired, False if they wait at a new table.
+        '''
+        bucket = None if rating is None else rating // RATING_BUCKET
+        if opponent is not None:
+            table = self.by_name.get((size, opponent))
+            if table is not None and self.seeks[table.board_id][3] in (None, name):
+                return self.take(table), True
+        else:
+            table = self.challenges.get((size, name))
+            if table is None:
+                for key in ((size, bucket),) if bucket is None else ((size, bucket), (size, bucket - 1), (size, bucket + 1)):
+                    queue = self.queues.get(key)
+                    if queue:
+                        table = next(iter(queue.values()))
+                        break
+            if table is not None:
+                return self.take(table), True
+
+        table = self.new_table(self.new_id(), size)
+        self.add(table)
+        self.seeks[table.board_id] = (size, name, bucket, opponent)
+        self.by_name[(size, name)] = table
+        if opponent is not None:
+            self.challenges[(size, opponent)] = table
+        else:
+            self.queues.setdefault((size, bucket), OrderedDict())[table.board_id] = table
+        return table, False
+
+    def take(self, table: Table) -> Table:
+        '''
+        Remove a table from the waiting indexes.
+        '''
+        size, name, bucket, opponent = self.seeks.pop(table.board_id)
+        if self.by_name.get((size, name)) is table:
+            del self.by_name[(size, name)]
+        if opponent is not None:
+            if self.challenges.get((size, opponent)) is table:
+                del self.challenges[(size, opponent)]
+        else:
+            queue = self.queues[(size, bucket)]
+            del queue[table.board_id]
+            if not queue:
+                del self.queues[(size, bucket)]
+        return table
+
+    def remove(self, table: Table) -> None:
+        '''
+        Forget a table whose game is over, or whose player left before finding an opponent.
+        '''
+        if table.board_id in self.seeks:
+            self.take(table)
+        self.tables.pop(table.board_id, None)
+
+    def waiting(self) -> int:
+        return len(self.seeks)
@@ -1,27 +1,65 @@
-from scripts.pieces import Piece
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from scripts.pieces import Piece
 
 import re
 
+MOVE_SQUARE_BITS = 7
+MOVE_SQUARE_MASK = (1 << MOVE_SQUARE_BITS) - 1
+CAPTURE_SHIFT = 2 * MOVE_SQUARE_BITS
+
+def pack_move(from_sq: int, to_sq: int, captured: int = 0) -> int:
+    '''
+    Pack a move into a single int: from square in the low bits, to square above it
+    and the mask of the captured pieces, if known, above both.
+    Squares are row * width + col, so 7 bits are enough for the 11x11 board.
+    '''
+    return from_sq | (to_sq << MOVE_SQUARE_BITS) | (captured << CAPTURE_SHIFT)
+
+def unpack_move(packed: int) -> tuple[int, int]:
+    return packed & MOVE_SQUARE_MASK, (packed >> MOVE_SQUARE_BITS) & MOVE_SQUARE_MASK
+
+def packed_captures(packed: int) -> int:
+    return packed >> CAPTURE_SHIFT
+
 class Move:
-    def __init__(self, from_row: int, from_col: int, to_row: int, to_col: int, size: int = 9, is_capture: bool = False, captured_pieces: list[Piece] = None):
+    '''
+    A move as shown to the players and sent over the network. The search uses packed ints instead.
+    The captures are filled in by the board that plays the move.
+    '''
+    __slots__ = ('size', 'from_row', 'from_col', 'to_row', 'to_col', 'is_capture', 'captured_pieces')
+
+    def __init__(self, from_row: int, from_col: int, to_row: int, to_col: int, size: int = 9, is_capture: bool = False, captured_pieces: tuple[Piece, ...] = ()):
         self.size = size
         self.from_row = from_row
         self.from_col = from_col
         self.to_row = to_row
         self.to_col = to_col
         self.is_capture = is_capture
-        self.captured_pieces: list[Piece] = [] if captured_pieces is None else captured_pieces
+        self.captured_pieces: tuple[Piece, ...] = captured_pieces
+
+    def pack(self, width: int) -> int:
+        return pack_move(self.from_row * width + self.from_col, self.to_row * width + self.to_col)
 
     def __eq__(self, other: 'Move'):
-        assert isinstance(other, Move)
+        if not isinstance(other, Move):
+            return NotImplemented
         return self.from_row == other.from_row and self.from_col == other.from_col and self.to_row == other.to_row and self.to_col == other.to_col
 
+    def __hash__(self):
+        return hash((self.from_row, self.from_col, self.to_row, self.to_col))
+
     def __str__(self):
         return f"{chr(self.from_col + 97)}{-self.from_row + self.size}-{chr(self.to_col + 97)}{-self.to_row + self.size}{'x' + '/'.join([chr(piece.col + 97) + str(-piece.row + self.size) for piece in self.captured_pieces]) if self.is_capture else ''}"
     
     def __repr__(self):
         return f"Move from ({self.from_row}, {self.from_col}) to ({self.to_row}, {self.to_col}) with captures: {self.captured_pieces}"
     
+def move_from_packed(packed: int, width: int, size: int = None) -> Move:
+    from_sq, to_sq = unpack_move(packed)
+    return Move(*divmod(from_sq, width), *divmod(to_sq, width), width if size is None else size)
+    
 def parse_move_9x9(move: str) -> Move:
     if re.match(r"[a-h][1-9][a-h][1-9]", move) is None:
         raise ValueError("Invalid move format")
@@ -0,0 +1,221 @@
+import asyncio
+import random
+import time
+
+from scripts.bitboard import BitBoard
+from scripts.bot import Bot, TT_SIZE_MB
+from scripts.move import Move, move_from_packed
+from scripts.protocol import OP_MOVE, BINARY_FLAG, encode_text, encode_move, read_message
+from scripts.transposition import TranspositionTable
+from scripts.constants import PORT, END_CONNECTION
+
+MAX_MESSAGE_SIZE = 1024
+
+# Results of a game for one client
+WIN = "win"
+LOSS = "loss"
+ABORTED = "aborted"     # Stopped at max_plies, or the server ended it without a winner
+ERROR = "error"         # Refused, protocol error or lost connection
+
+class RandomPlayer:
+    '''
+    Plays a random legal move.
+    '''
+    threaded = False    # Whether choose blocks long enough to run outside the event loop
+
+    def __init__(self, seed: int = None):
+        self.rng = random.Random(seed)
+
+    def choose(self, board: BitBoard) -> Move:
+        return move_from_packed(self.rng.choice(board.packed_moves()), board.width, board.height)
+
+    def close(self) -> None:
+        pass
+
+class BotPlayer:
+    '''
+    Plays the moves of a Bot searching on the board of the client. The search blocks, so
+    the client runs it in a thread. With a clock the bot keeps its own game clock, which
+    starts again at every game.
+    '''
+    threaded = True
+
+    def __init__(self, max_depth: int = None, max_time: float = None, tt_size_mb: float = TT_SIZE_MB,
+                 clock: float = None, increment: float = 0):
+        self.max_depth = max_depth
+        self.max_time = max_time
+        self.tt_size_mb = tt_size_mb
+        self.clock = clock
+        self.increment = increment
+        self.bot: Bot = None
+        self.board: BitBoard = None     # Board of the current game, play_game makes a new one for every game
+
+    def choose(self, board: BitBoard) -> Move:
+        if self.bot is None:
+            self.bot = Bot(board.width, board.turn, TranspositionTable(self.tt_size_mb))
+            if self.max_depth is not None:
+                self.bot.max_depth = self.max_depth
+            if self.max_time is not None:
+                self.bot.max_time = self.max_time
+            self.bot.increment = self.increment
+        if board is not self.board:
+            self.board = board
+            self.bot.clock = self.clock
+        self.bot.board = board
+        self.bot.color = board.turn
+        start = time.monotonic()
+        move = self.bot.get_move(start)
+        self.bot.use_time(time.monotonic() - start)
+        return move
+
+    def close(self) -> None:
+        if self.bot is not None:
+            self.bot.close()
+            self.bot = None
+            self.board = None
+
+class GameResult:
+    '''
+    What one client saw of a game.
+    '''
+    __slots__ = ('name', 'color', 'result', 'plies', 'move_times', 'think_time', 'error')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.color: int = None
+        self.result = ERROR
+        self.plies = 0
+        self.move_times: list[float] = []     # Seconds from sending each move to the server sending it back
+        self.think_time = 0.0
+        self.error = ""
+
+async def play_game(player, size: int, name: str, host: str = "127.0.0.1", port: int = PORT, binary: bool = True,
+                    rating: int = None, opponent: str = None, max_plies: int = None, joined: asyncio.Event = None) -> GameResult:
+    '''
+    Join a game on the server and play it to the end with a player.
+
+    Parameters:
+        player: A RandomPlayer, a BotPlayer or any object with their threaded attribute and choose method.
+        size (int): The board size.
+        name (str): The name of the client, up to 16 letters, digits or underscores.
+        binary (bool): Ask for the binary protocol.
+        rating (int): The rating sent to the matchmaking.
+        opponent (str): Only play against the client of this name.
+        max_plies (int): Leave the game when it gets this long, the game is then lost and counted as ABORTED.
+        joined (asyncio.Event): Set once the server gave the client a color, None to not wait for it.
+
+    Returns:
+        GameResult: The result of the game.
+    '''
+    result = GameResult(name)
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError as e:
+        result.error = f"connect: {e}"
+        return result
+
+    loop = asyncio.get_running_loop()
+    try:
+        info = f"info {size} {name}"
+        if binary:
+            info += f" {BINARY_FLAG}"
+        if rating is not None:
+            info += f" rating {rating}"
+        if opponent is not None:
+            info += f" opponent {opponent}"
+        writer.write(encode_text(info))
+
+        msg = await read_message(reader, False, size, MAX_MESSAGE_SIZE)
+        if msg is None or not msg[1].startswith("color "):
+            result.error = f"color: {msg[1] if msg is not None else 'connection closed'}"
+            return result
+        words = msg[1].split()
+        color = result.color = int(words[1])
+        binary = BINARY_FLAG in words[2:]
+        if joined is not None:
+            joined.set()
+
+        board = BitBoard(size, size)
+        started = False
+        sent_at: float = None       # When the move waiting for its echo was sent
+        while True:
+            if started and sent_at is None and board.turn == color and board.winner is None:
+                if max_plies is not None and len(board.list_of_moves) >= max_plies:
+                    writer.write(encode_text(END_CONNECTION, binary))
+                    result.result = ABORTED
+                    break
+                start = time.perf_counter()
+                if player.threaded:
+                    move = await loop.run_in_executor(None, player.choose, board)
+                else:
+                    move = player.choose(board)
+                result.think_time += time.perf_counter() - start
+                writer.write(encode_move((move.from_row, move.from_col, move.to_row, move.to_col), size, binary))
+                sent_at = time.perf_counter()
+
+            msg = await read_message(reader, binary, size, MAX_MESSAGE_SIZE)
+            if msg is None:
+                result.error = "connection lost"
+                break
+            opcode, payload = msg
+            if opcode == OP_MOVE:
+                if sent_at is not None and board.turn == color:
+                    result.move_times.append(time.perf_counter() - sent_at)
+                    sent_at = None
+                if not board.move_piece_by_move(Move(*payload, size)):
+                    result.error = f"illegal move from the server: {payload}"
+                    break
+                if board.winner is not None:
+                    result.result = WIN if board.winner == color else LOSS
+                    break
+            elif payload.startswith("start "):
+                started = True
+            elif payload == "win":      # The opponent left
+                result.result = ABORTED if max_plies is not None and len(board.list_of_moves) >= max_plies else WIN
+                break
+            elif payload == END_CONNECTION:
+                result.result = ABORTED
+                break
+            elif payload == "invalid move":
+                result.error = "move refused by the server"
+                break
+        result.plies = len(board.list_of_moves)
+        return result
+    finally:
+        writer.close()
+
+async def play_match(players: tuple, names: tuple[str, str], games: int, size: int, **options) -> list[tuple[GameResult, GameResult]]:
+    '''
+    Play games between two players, which take turns at moving first. The clients ask
+    for each other by name, so matches running side by side never mix.
+
+    Parameters:
+        players (tuple): The two players.
+        names (tuple[str, str]): The names of their clients.
+        games (int): The number of games.
+        size (int): The board size.
+        options: The other arguments of play_game.
+
+    Returns:
+        list[tuple[GameResult, GameResult]]: The results of both clients, game by game.
+    '''
+    results = []
+    for game in range(games):
+        first, second = (0, 1) if game % 2 == 0 else (1, 0)
+        joined = asyncio.Event()
+        # The client that waits at a new table is black, the second one joins once it is there
+        first_task = asyncio.create_task(play_game(players[first], size, names[first], opponent=names[second], joined=joined, **options))
+        waiter = asyncio.create_task(joined.wait())
+        await asyncio.wait((first_task, waiter), return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if not joined.is_set():
+            second_result = GameResult(names[second])
+            second_result.error = "no game to join"
+        else:
+            second_result = await play_game(players[second], size, names[second], opponent=names[first], **options)
+        first_result = await first_task
+
+        game_results = [None, None]
+        game_results[first], game_results[second] = first_result, second_result
+        results.append(tuple(game_results))
+    return results
@@ -0,0 +1,119 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from scripts.bitboard import BitBoard
+
+from array import array
+
+import numpy as np
+
+from scripts.board import MAX_SQUARES
+from scripts.move import MOVE_SQUARE_BITS, MOVE_SQUARE_MASK
+
+MAX_PLY = 64
+
+# Move scores, from the first tried to the last
+TT_MOVE_SCORE = 1 << 30
+KING_CAPTURE_SCORE = TT_MOVE_SCORE - 1
+CAPTURE_SCORE = 1 << 28
+CAPTURED_PIECE_SCORE = 1 << 20
+KILLER_SCORE = 1 << 26
+HISTORY_LIMIT = KILLER_SCORE - 2
+HISTORY_NOISE = 16
+
+class MoveOrderer:
+    '''
+    Move ordering for the search: the transposition table move first, then captures
+    (more captured pieces first) and king moves to the edge, then the killer moves of
+    the ply, then the quiet moves by history score.
+
+    Killer moves are the last two quiet moves that caused a beta cutoff at each ply.
+    The history (butterfly) table counts the cutoffs of every from/to pair, weighted by depth.
+    It is a flat array, read entry by entry while ordering, and aged in one step through a
+    NumPy view of the same memory.
+    '''
+    def __init__(self, seed: int = None):
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [array('i', bytes(4 * MAX_SQUARES * MAX_SQUARES)) for _ in range(2)]
+        self.history_views = [np.frombuffer(history, dtype=np.int32) for history in self.history]
+
+        # With a seed, small random history values break the ties between quiet moves differently
+        self.rng = np.random.default_rng(seed) if seed is not None else None
+
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self) -> None:
+        '''
+        Forget the killers and age the history so older searches weigh less.
+        '''
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        for view in self.history_views:
+            view >>= 1
+            if self.rng is not None:
+                view += self.rng.integers(HISTORY_NOISE, size=len(view), dtype=np.int32)
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def order(self, board: BitBoard, moves: list[int], tt_move: int = 0, ply: int = 0) -> list[int]:
+        '''
+        Sort the packed moves in place, best first. Every move is scored once.
+        '''
+        turn = board.turn
+        king = board.king
+        capture_targets = board.capture_targets(turn)
+        edge_mask = board.geometry.edge_mask
+        captures = board.captures
+        history = self.history[turn]
+        killer1, killer2 = self.killers[ply] if ply < MAX_PLY else (0, 0)
+
+        def score(move: int) -> int:
+            if move == tt_move:
+                return TT_MOVE_SCORE
+            from_sq = move & MOVE_SQUARE_MASK
+            to_sq = move >> MOVE_SQUARE_BITS
+            if capture_targets >> to_sq & 1:
+                captured = captures(from_sq, to_sq)
+                if captured & king:
+                    return KING_CAPTURE_SCORE
+                return CAPTURE_SCORE + captured.bit_count() * CAPTURED_PIECE_SCORE
+            if king >> from_sq & 1 and edge_mask >> to_sq & 1:
+                return CAPTURE_SCORE
+            if move == killer1:
+                return KILLER_SCORE + 1
+            if move == killer2:
+                return KILLER_SCORE
+            return history[from_sq * MAX_SQUARES + to_sq]
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def record_cutoff(self, board: BitBoard, move: int, ply: int, depth: int, move_number: int) -> None:
+        '''
+        Update the statistics, killers and history after move caused a beta cutoff.
+        The board must be in the position the move was played from.
+        '''
+        self.cutoffs += 1
+        if move_number == 0:
+            self.first_move_cutoffs += 1
+
+        from_sq = move & MOVE_SQUARE_MASK
+        to_sq = move >> MOVE_SQUARE_BITS
+        if board.capture_targets(board.turn) >> to_sq & 1:
+            return
+
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+
+        history = self.history[board.turn]
+        index = from_sq * MAX_SQUARES + to_sq
+        history[index] += depth * depth
+        if history[index] > HISTORY_LIMIT:
+            self.history_views[board.turn] >>= 1
+
+    def first_move_cutoff_rate(self) -> float:
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
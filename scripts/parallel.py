@@ -0,0 +1,135 @@
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+from scripts.bot import Bot, TT_SIZE_MB, INF
+from scripts.move import Move
+from scripts.transposition import TranspositionTable, table_bytes
+from scripts.constants import DEBUG
+
+JOB_DONE = -1           # Depth of the message a helper sends once it stopped searching a job
+HELPER_STOP_TIMEOUT = 1     # Seconds to wait for the next message of a stopping helper before giving up on it
+
+def search_worker(worker_id: int, tt_name: str, tt_size_mb: float, jobs: multiprocessing.Queue, results: multiprocessing.Queue, current_job):
+    '''
+    Helper process of the Lazy SMP search. It waits for jobs, replays the game on its
+    own board and searches it with the shared transposition table, reporting every
+    completed iteration until the main process moves on to another job, and then
+    reports that it is done with the job.
+    '''
+    shm = shared_memory.SharedMemory(name=tt_name)
+    transposition_table = TranspositionTable(tt_size_mb, shm.buf)
+    bot = None
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        job_id, size, color, moves, start_time = job
+        if bot is None or bot.board.width != size:
+            bot = Bot(size, color, transposition_table, ordering_seed=worker_id)
+            bot.depth_offset = worker_id % 2     # Half of the helpers skip depth 1, so they are one ply ahead
+            bot.max_time = INF      # Helpers search until the main process moves on
+        bot.color = color
+        bot.board.reset(size, size)
+        for move in moves:
+            bot.board.move_piece_by_move(Move(*move, size))
+
+        bot.abort_check = lambda: current_job.value != job_id
+        bot.iteration_callback = lambda depth, eval, move: results.put((job_id, worker_id, depth, eval, (move.from_row, move.from_col, move.to_row, move.to_col)))
+        bot.search(start_time)
+        results.put((job_id, worker_id, JOB_DONE, 0, None))
+
+    transposition_table.release()
+    shm.close()
+
+class ParallelBot(Bot):
+    '''
+    Lazy SMP search: helper processes search the same position as this bot, each on its own
+    board, sharing one transposition table in shared memory. Helpers differ in the
+    starting depth and the move ordering, so they fill the table with different parts of
+    the tree. When the time is up the deepest completed iteration of any process is played.
+    '''
+    def __init__(self, size: int, color: int, processes: int = None) -> None:
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        self.shm = shared_memory.SharedMemory(create=True, size=table_bytes(TT_SIZE_MB))
+        super().__init__(size, color, TranspositionTable(TT_SIZE_MB, self.shm.buf))
+        self.transposition_table.clear()
+
+        self.job_id = 0
+        self.current_job = multiprocessing.Value('i', 0, lock=False)
+        self.results = multiprocessing.Queue()
+        self.jobs: list[multiprocessing.Queue] = []
+        self.workers: list[multiprocessing.Process] = []
+        for worker_id in range(1, processes):
+            jobs = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=search_worker, args=(worker_id, self.shm.name, TT_SIZE_MB, jobs, self.results, self.current_job), daemon=True)
+            worker.start()
+            self.jobs.append(jobs)
+            self.workers.append(worker)
+
+    def get_move(self, start_time: float = None) -> Move:
+        book_move = self.book_move()
+        if book_move is not None:
+            return book_move
+        if self.board.list_of_moves == []:
+            return super().get_move(start_time)
+
+        self.job_id += 1
+        self.current_job.value = self.job_id
+        if start_time is None:
+            start_time = time.monotonic()
+        moves = [(move.from_row, move.from_col, move.to_row, move.to_col) for move in self.board.list_of_moves]
+        for jobs in self.jobs:
+            jobs.put((self.job_id, self.board.width, self.color, moves, start_time))
+
+        main_depth = 0
+        def record_iteration(depth: int, eval: int, move: Move):
+            nonlocal main_depth
+            main_depth = depth
+        self.iteration_callback = record_iteration
+        best_move = self.search(start_time)
+        self.current_job.value = 0     # Stop the helpers
+
+        # A result put just before the stop can still be on its way through the queue, so
+        # the results are read until every helper has said it is done with the job
+        best_depth = main_depth
+        running = len(self.workers)
+        while running:
+            try:
+                job_id, worker_id, depth, eval, move = self.results.get(timeout=HELPER_STOP_TIMEOUT)
+            except queue.Empty:
+                if DEBUG:
+                    print(f"{running} helpers did not stop in time")
+                break
+            if job_id != self.job_id:
+                continue    # Left over from a job the helpers were still stopping
+            if depth == JOB_DONE:
+                running -= 1
+            elif depth > best_depth:
+                best_depth = depth
+                best_move = Move(*move, self.board.height)
+                if DEBUG:
+                    print(f"Helper {worker_id} reached depth {depth}, Eval: {eval}, Move: {best_move}")
+
+        return best_move
+
+    def close(self) -> None:
+        self.current_job.value = 0
+        for jobs in self.jobs:
+            jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+        self.jobs = []
+        self.workers = []
+
+        self.transposition_table.release()
+        self.shm.close()
+        self.shm.unlink()
+        super().close()
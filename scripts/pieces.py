@@ -6,112 +6,165 @@ if TYPE_CHECKING:
 import pygame
 
 from scripts.constants import SQUARE_SIZE, WHITE, BLACK, ROOK, KING
+from scripts.move import Move
 
 ADJECENT_SQUARES = [(0, 1), (0, -1), (1, 0), (-1, 0)]
 
+# Integer piece codes stored in the squares of a Board, 0 is an empty square
+EMPTY = 0
+ATTACKER_CODE = 1
+DEFENDER_CODE = 2
+KING_CODE = 3
+
+# (color, type) of every piece code
+PIECE_TYPES = [None, (BLACK, ROOK), (WHITE, ROOK), (WHITE, KING)]
+
+def piece_code(color: int, type_p: int) -> int:
+    if type_p == KING:
+        return KING_CODE
+    return DEFENDER_CODE if color == WHITE else ATTACKER_CODE
+
 class Piece:
-    def __init__(self, board: Board, row: int, col: int, color: int, type_p: int):
-        self.board = board
-        self.row = row
-        self.col = col
-        self.color = color
-        self.type = type_p
-
-    def move(self, row: int, col: int):
-        self.row = row
-        self.col = col
-
-    def check_capture(self, row: int, col: int) -> bool:
+    '''
+    Immutable view of a piece on a square. Boards store piece codes and build these on
+    demand, so the methods that need the position take the board as an argument.
+    '''
+    __slots__ = ('row', 'col', 'color', 'type')
+
+    def __init__(self, row: int, col: int, color: int, type_p: int):
+        object.__setattr__(self, 'row', row)
+        object.__setattr__(self, 'col', col)
+        object.__setattr__(self, 'color', color)
+        object.__setattr__(self, 'type', type_p)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Piece is immutable")
+
+    @property
+    def code(self) -> int:
+        return piece_code(self.color, self.type)
+
+    def moved(self, row: int, col: int) -> Piece:
+        return Piece(row, col, self.color, self.type)
+
+    def check_capture(self, board: Board, row: int, col: int) -> bool:
         '''
         Check if the piece can capture the piece at the given row and column.
 
         Parameters:
+            board (Board): The board the piece is on.
             row (int): The row of the piece to capture.
             col (int): The column of the piece to capture.
 
         Returns:
             bool: True if the piece can capture the piece at the given row and column, False otherwise.
         '''
-        piece = self.board.get_piece(row, col)
-        
+        piece = board.get_piece(row, col)
+
         if piece is None:
             return False
-        
+
         if piece.color != self.color:
             if piece.type == ROOK:
                 direction = (row - self.row, col - self.col)
-                opposite_piece = self.board.get_piece(row + direction[0], col + direction[1])
-                return (opposite_piece is not None and opposite_piece.color == self.color) or self.board.is_empty_castle(row + direction[0], col + direction[1])
+                opposite_piece = board.get_piece(row + direction[0], col + direction[1])
+                return (opposite_piece is not None and opposite_piece.color == self.color) or board.is_empty_castle(row + direction[0], col + direction[1])
             elif piece.type == KING:
                 orthogonal = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-                orthogonal_pieces = [self.board.get_piece(row + dr, col + dc) for dr, dc in orthogonal]
+                orthogonal_pieces = [board.get_piece(row + dr, col + dc) for dr, dc in orthogonal]
                 return all((ortho_piece is not None and ortho_piece.color == BLACK) or \
-                           self.board.is_empty_castle(row + dr, col + dc) or \
-                            (row + dr < 0 or row + dr >= self.board.height or col + dc < 0 or col + dc >= self.board.width) \
+                           board.is_empty_castle(row + dr, col + dc) or \
+                            (row + dr < 0 or row + dr >= board.height or col + dc < 0 or col + dc >= board.width) \
                             for ortho_piece, (dr, dc) in zip(orthogonal_pieces, orthogonal))
 
-    def check_legal_move(self, row: int, col: int) -> bool:
+    def check_legal_move(self, board: Board, row: int, col: int) -> bool:
         if (row != self.row and col != self.col) or (row == self.row and col == self.col):
             return False
 
-        if self.board.get_piece(row, col) is not None:
+        if board.get_piece(row, col) is not None:
             return False
-        
-        if self.type != KING and (row, col) in self.board.CASTLE_POSITIONS:
+
+        if self.type != KING and (row, col) in board.CASTLE_POSITIONS:
             return False
-        
+
         if row == self.row:
             for c in range(min(self.col, col) + 1, max(self.col, col)):
-                if self.board.get_piece(row, c) is not None:
+                if board.get_piece(row, c) is not None:
                     return False
-                
+
         if col == self.col:
             for r in range(min(self.row, row) + 1, max(self.row, row)):
-                if self.board.get_piece(r, col) is not None:
+                if board.get_piece(r, col) is not None:
                     return False
-        
+
         return True
-    
-    def legal_moves(self) -> list[tuple[int, int]]:
-        moves = []
-        
-        for r in range(self.board.height):
-            if self.check_legal_move(r, self.col):
-                moves.append((r, self.col))
-        
-        for c in range(self.board.width):
-            if self.check_legal_move(self.row, c):
-                moves.append((self.row, c))
-
-        return moves
-    
-    def render(self, screen: pygame.Surface):
-        asset = self.board.assets[self.color][self.type]
+
+    def ray_moves(self, board: Board):
+        '''
+        Walk outward from the piece in the four directions, stopping at the first blocker,
+        and yield every square the piece can move to.
+        '''
+        is_king = self.type == KING
+        for dr, dc in ADJECENT_SQUARES:
+            r, c = self.row + dr, self.col + dc
+            while 0 <= r < board.height and 0 <= c < board.width:
+                if board.get_piece(r, c) is not None:
+                    break
+                if is_king or (r, c) not in board.CASTLE_POSITIONS:   # Castles can be crossed but only the king can stop on them
+                    yield r, c
+                r += dr
+                c += dc
+
+    def generate_moves(self, board: Board):
+        '''
+        Lazily yield the legal moves of the piece as Move objects.
+        '''
+        for row, col in self.ray_moves(board):
+            yield Move(self.row, self.col, row, col, board.height)
+
+    def has_legal_move(self, board: Board) -> bool:
+        for _ in self.ray_moves(board):
+            return True
+        return False
+
+    def legal_moves(self, board: Board) -> list[tuple[int, int]]:
+        return list(self.ray_moves(board))
+
+    def render(self, screen: pygame.Surface, assets: dict):
         x, y = self.col * SQUARE_SIZE, self.row * SQUARE_SIZE
-        screen.blit(asset, (x, y))
-        
+        screen.blit(assets[self.color][self.type], (x, y))
+
     def __repr__(self) -> str:
         color = "Red" if self.color == WHITE else "Blue"
         type_p = "Rook" if self.type == ROOK else "King"
         return f"{color} {type_p} at ({self.row}, {self.col})"
-    
+
     def __str__(self) -> str:
         type_p = "R" if self.type == ROOK else "K"
         if self.color == WHITE:
             return type_p
         return type_p.lower()
 
-    
+
     def __eq__(self, other: Piece) -> bool:
+        if not isinstance(other, Piece):
+            return NotImplemented
         return self.row == other.row and self.col == other.col and self.color == other.color and self.type == other.type
 
     def __ne__(self, other: Piece) -> bool:
         return not self == other
-    
+
+    def __hash__(self) -> int:
+        return hash((self.row, self.col, self.color, self.type))
+
 class Rook(Piece):
-    def __init__(self, board: Board, row: int, col: int, color: int):
-        super().__init__(board, row, col, color, ROOK)
+    __slots__ = ()
+
+    def __init__(self, row: int, col: int, color: int):
+        super().__init__(row, col, color, ROOK)
 
 class King(Piece):
-    def __init__(self, board: Board, row: int, col: int, color: int):
-        super().__init__(board, row, col, color, KING)
\ No newline at end of file
+    __slots__ = ()
+
+    def __init__(self, row: int, col: int, color: int):
+        super().__init__(row, col, color, KING)
@@ -0,0 +1,129 @@
+import asyncio
+import re
+import socket
+
+from struct import Struct
+
+from scripts.constants import ENCODER, MESSAGE_LENGTH
+
+# A connection starts with the text protocol: every message is a 4 byte length followed
+# by the UTF-8 text. A client that adds BINARY_FLAG to its info message and gets it back
+# in the color message switches to the binary protocol for the rest of the connection.
+# Binary frames start with an opcode: a move is the opcode and the from and to squares
+# (row * size + col) in one byte each, any other message is the opcode, a 2 byte length
+# and the text.
+BINARY_FLAG = "binary"
+
+OP_MOVE = 1
+OP_TEXT = 2
+
+TEXT_HEADER = Struct('!I')
+MOVE_FRAME = Struct('!BBB')
+TEXT_FRAME_HEADER = Struct('!BH')
+
+MOVE_PATTERN = re.compile(r"move (\d{1,2}) (\d{1,2}) (\d{1,2}) (\d{1,2})")
+
+# A spectator gets the position of the game in one text message when it starts watching,
+# then the moves like the players: "snapshot <size> <turn> <moves played> <player1> <player2> <squares>"
+# where squares is the piece code of every square, row by row, as one digit each.
+SNAPSHOT_PATTERN = re.compile(r"snapshot (\d{1,2}) ([01]) (\d+) ([a-zA-Z0-9_]{1,16}) ([a-zA-Z0-9_]{1,16}) ([0-3]+)")
+
+Message = tuple[int, str | tuple[int, int, int, int]]    # (OP_MOVE, (from_row, from_col, to_row, to_col)) or (OP_TEXT, text)
+
+def encode_text(msg: str, binary: bool = False) -> bytes:
+    data = msg.encode(ENCODER)
+    if binary:
+        return TEXT_FRAME_HEADER.pack(OP_TEXT, len(data)) + data
+    return TEXT_HEADER.pack(len(data)) + data
+
+def encode_move(move: tuple[int, int, int, int], size: int, binary: bool = False) -> bytes:
+    from_row, from_col, to_row, to_col = move
+    if binary:
+        return MOVE_FRAME.pack(OP_MOVE, from_row * size + from_col, to_row * size + to_col)
+    return encode_text(f"move {from_row} {from_col} {to_row} {to_col}")
+
+def encode_snapshot(size: int, turn: int, moves: int, player1: str, player2: str, squares: list[int]) -> str:
+    return f"snapshot {size} {int(turn)} {moves} {player1} {player2} {''.join(map(str, squares))}"
+
+def parse_snapshot(msg: str) -> tuple[int, int, int, str, str, list[int]] | None:
+    '''
+    Returns:
+        tuple[int, int, int, str, str, list[int]] | None: (size, turn, moves played, player1, player2, squares),
+        or None if msg is not a valid snapshot.
+    '''
+    match = SNAPSHOT_PATTERN.fullmatch(msg)
+    if match is None:
+        return None
+    size = int(match.group(1))
+    squares = [int(c) for c in match.group(6)]
+    if len(squares) != size * size:
+        return None
+    return size, int(match.group(2)), int(match.group(3)), match.group(4), match.group(5), squares
+
+def parse_text(msg: str) -> Message:
+    '''
+    Turn a message of the text protocol into the same form as the binary messages.
+    '''
+    match = MOVE_PATTERN.match(msg)
+    if match is not None:
+        return OP_MOVE, tuple(map(int, match.groups()))
+    return OP_TEXT, msg
+
+def decode_move(from_sq: int, to_sq: int, size: int) -> tuple[int, int, int, int]:
+    return from_sq // size, from_sq % size, to_sq // size, to_sq % size
+
+async def read_message(reader: asyncio.StreamReader, binary: bool, size: int, max_size: int) -> Message | None:
+    '''
+    Read one message from a stream.
+
+    Returns:
+        Message | None: The message, or None if the connection is closed or the peer broke the protocol.
+    '''
+    try:
+        if binary:
+            opcode = (await reader.readexactly(1))[0]
+            if opcode == OP_MOVE:
+                from_sq, to_sq = await reader.readexactly(2)
+                return OP_MOVE, decode_move(from_sq, to_sq, size)
+            if opcode != OP_TEXT:
+                print(f"Unknown opcode: {opcode}")
+                return None
+            msg_len = int.from_bytes(await reader.readexactly(2), 'big')
+        else:
+            msg_len = TEXT_HEADER.unpack(await reader.readexactly(MESSAGE_LENGTH))[0]
+        if msg_len > max_size:
+            print(f"Message too long: {msg_len} bytes")
+            return None
+        msg = (await reader.readexactly(msg_len)).decode(ENCODER)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except UnicodeDecodeError as e:
+        print(f"Decoding error: {e}")
+        return None
+    return (OP_TEXT, msg) if binary else parse_text(msg)
+
+def recv_exactly(conn: socket.socket, n: int) -> bytes:
+    data = b""
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+def recv_message(conn: socket.socket, binary: bool, size: int) -> Message:
+    '''
+    Blocking version of read_message for plain sockets. Raises ConnectionError if the connection is closed.
+    '''
+    if binary:
+        opcode = recv_exactly(conn, 1)[0]
+        if opcode == OP_MOVE:
+            from_sq, to_sq = recv_exactly(conn, 2)
+            return OP_MOVE, decode_move(from_sq, to_sq, size)
+        if opcode != OP_TEXT:
+            raise ConnectionError(f"Unknown opcode: {opcode}")
+        msg_len = int.from_bytes(recv_exactly(conn, 2), 'big')
+        return OP_TEXT, recv_exactly(conn, msg_len).decode(ENCODER)
+
+    msg_len = TEXT_HEADER.unpack(recv_exactly(conn, MESSAGE_LENGTH))[0]
+    return parse_text(recv_exactly(conn, msg_len).decode(ENCODER))
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from scripts.bitboard import BitBoard
+
+import mmap
+import os
+from math import comb
+from struct import Struct
+
+# A tablebase file holds the exact result of every position of some material
+# classes: the king with a attackers and d defenders. Each class stores one
+# byte per position, first all the positions with white to move, then those
+# with black to move. Within a side the index is
+#     (king square * C(squares, a) + rank(attackers)) * C(squares, d) + rank(defenders)
+# where rank is the combinatorial number of the set of squares. Indexes that
+# are not a valid position (overlapping pieces, rooks on castles, the king on
+# a corner) hold DRAW and are never probed.
+TABLEBASE_MAGIC = b"HNTB"
+TABLEBASE_VERSION = 1
+HEADER = Struct('<4sHBBH')      # magic, version, width, height, number of classes
+CLASS_ENTRY = Struct('<BBQ')    # attackers, defenders, offset of the values in the file
+
+# Result byte of a position, from the point of view of the side to move
+DRAW = 0            # Neither side can force a win, or not a position
+LOSS_FLAG = 0x80    # Loss in (value & DISTANCE_MASK) plies, otherwise a win in value plies
+DISTANCE_MASK = 0x7F
+
+WIN = 1
+LOSS = -1
+
+def encode_result(result: int, distance: int) -> int:
+    if result == DRAW:
+        return DRAW
+    if distance > DISTANCE_MASK:
+        raise ValueError(f"Distance too long for the tablebase: {distance}")
+    return LOSS_FLAG | distance if result == LOSS else distance
+
+def decode_result(value: int) -> tuple[int, int]:
+    '''
+    Returns:
+        tuple[int, int]: (WIN, LOSS or DRAW, the number of plies to the end of the game).
+    '''
+    if value == DRAW:
+        return DRAW, 0
+    if value & LOSS_FLAG:
+        return LOSS, value & DISTANCE_MASK
+    return WIN, value
+
+def rank_squares(mask: int) -> int:
+    '''
+    Combinatorial number of a set of squares: the position of the set among the sets of the same size.
+    '''
+    rank = 0
+    i = 1
+    while mask:
+        bit = mask & -mask
+        rank += comb(bit.bit_length() - 1, i)
+        mask ^= bit
+        i += 1
+    return rank
+
+def class_size(num_squares: int, attackers: int, defenders: int) -> int:
+    '''
+    Number of positions of one side to move in a material class.
+    '''
+    return num_squares * comb(num_squares, attackers) * comb(num_squares, defenders)
+
+class Tablebase:
+    '''
+    Read-only endgame tablebase. Like the opening book, the file is memory-mapped and a
+    probe reads a single byte.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:      # Empty file
+            self.file.close()
+            raise ValueError(f"Invalid tablebase: {path}")
+
+        if len(self.data) < HEADER.size or HEADER.unpack_from(self.data, 0)[:2] != (TABLEBASE_MAGIC, TABLEBASE_VERSION):
+            self.close()
+            raise ValueError(f"Invalid tablebase: {path}")
+        _, _, self.width, self.height, num_classes = HEADER.unpack_from(self.data, 0)
+        self.num_squares = self.width * self.height
+
+        # (attackers, defenders) -> (offset, C(squares, attackers), C(squares, defenders), size of one side)
+        self.classes: dict[tuple[int, int], tuple[int, int, int, int]] = {}
+        for i in range(num_classes):
+            attackers, defenders, offset = CLASS_ENTRY.unpack_from(self.data, HEADER.size + i * CLASS_ENTRY.size)
+            size = class_size(self.num_squares, attackers, defenders)
+            if offset + 2 * size > len(self.data):
+                self.close()
+                raise ValueError(f"Invalid tablebase: {path}")
+            self.classes[(attackers, defenders)] = (offset, comb(self.num_squares, attackers), comb(self.num_squares, defenders), size)
+        self.max_attackers = max((attackers for attackers, _ in self.classes), default=-1)
+        self.max_defenders = max((defenders for _, defenders in self.classes), default=-1)
+
+    @classmethod
+    def load(cls, path: str) -> Tablebase | None:
+        '''
+        Open a tablebase, or return None if there is no valid tablebase at path.
+        '''
+        try:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            if os.path.exists(path):
+                print(f"Tablebase error: {e}")
+            return None
+
+    def probe(self, board: BitBoard) -> tuple[int, int] | None:
+        '''
+        Look up the result of a position that is not over yet.
+
+        Returns:
+            tuple[int, int] | None: (WIN, LOSS or DRAW, plies to the end) for the side to move,
+            or None if the position is not covered by the tablebase.
+        '''
+        if board.width != self.width or board.height != self.height or not board.king:
+            return None
+        num_attackers = board.attackers.bit_count()
+        num_defenders = board.defenders.bit_count()
+        if num_attackers > self.max_attackers or num_defenders > self.max_defenders:
+            return None
+        material = self.classes.get((num_attackers, num_defenders))
+        if material is None:
+            return None
+
+        offset, attacker_sets, defender_sets, size = material
+        index = ((board.king.bit_length() - 1) * attacker_sets + rank_squares(board.attackers)) * defender_sets + rank_squares(board.defenders)
+        if board.turn:      # Black to move
+            index += size
+        return decode_result(self.data[offset + index])
+
+    def close(self) -> None:
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+    def __enter__(self) -> Tablebase:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,86 @@
+import time
+
+INF = float('inf')
+
+MOVES_TO_GO = 30            # Moves left in the game assumed when the time control does not say
+MOVE_OVERHEAD = 0.05        # Seconds of the clock kept on every move for the network and the UI
+INCREMENT_SHARE = 0.8       # Share of the increment spent on the current move
+SOFT_TIME_RATIO = 0.5       # With a fixed time per move, no iteration starts after this share of it
+HARD_TIME_FACTOR = 4        # On a clock, a move can take up to this many times its share of the time
+HARD_CLOCK_SHARE = 0.3      # but never more than this share of the clock
+STABLE_ITERATIONS = 3       # Iterations with the same best move after which the soft limit is cut
+STABLE_TIME_RATIO = 0.5
+SCORE_DROP = 30             # A score dropping this much since the previous iteration
+SCORE_DROP_FACTOR = 2       # extends the soft limit by this factor, up to the hard limit
+
+class TimeManager:
+    '''
+    Time limits of one search, measured with a monotonic clock.
+
+    The hard limit stops the search in the middle of an iteration, the soft limit is checked
+    between iterations: the next iteration takes longer than all the previous ones together,
+    so it is not started once the soft limit is reached. The soft limit shrinks when the best
+    move stays the same over several iterations and grows when the score drops.
+    '''
+    def __init__(self):
+        self.start_time = 0
+        self.soft_limit = INF
+        self.hard_limit = INF
+
+        self.best_move = None
+        self.stable_iterations = 0
+        self.last_eval = None
+
+    def start(self, max_time: float, clock: float = None, increment: float = 0, moves_to_go: int = None, start_time: float = None) -> None:
+        '''
+        Set the limits of a new search.
+
+        Parameters:
+            max_time (float): The time per move in seconds, used when there is no clock.
+            clock (float): The time left on the clock of the side to move in seconds, or None.
+            increment (float): The time added to the clock after every move.
+            moves_to_go (int): The moves left to play before the next time control, None for the whole game.
+            start_time (float): The time.monotonic() time the search started at, now by default.
+        '''
+        self.start_time = time.monotonic() if start_time is None else start_time
+        self.best_move = None
+        self.stable_iterations = 0
+        self.last_eval = None
+
+        if clock is None:
+            self.hard_limit = max_time
+            self.soft_limit = max_time * SOFT_TIME_RATIO
+            return
+
+        available = max(0.0, clock - MOVE_OVERHEAD)
+        moves = moves_to_go if moves_to_go else MOVES_TO_GO
+        share = available / moves + increment * INCREMENT_SHARE
+        self.hard_limit = min(share * HARD_TIME_FACTOR, available if moves == 1 else available * HARD_CLOCK_SHARE + increment * INCREMENT_SHARE, available)
+        self.soft_limit = min(share, self.hard_limit)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start_time
+
+    def hard_limit_reached(self) -> bool:
+        return time.monotonic() - self.start_time > self.hard_limit
+
+    def iteration_done(self, move: int, eval: int) -> bool:
+        '''
+        Record the result of a completed iteration.
+
+        Returns:
+            bool: True if the search should stop instead of starting the next iteration.
+        '''
+        if move == self.best_move:
+            self.stable_iterations += 1
+        else:
+            self.best_move = move
+            self.stable_iterations = 0
+
+        limit = self.soft_limit
+        if self.stable_iterations >= STABLE_ITERATIONS:
+            limit *= STABLE_TIME_RATIO
+        if self.last_eval is not None and eval < self.last_eval - SCORE_DROP:
+            limit *= SCORE_DROP_FACTOR
+        self.last_eval = eval
+        return self.elapsed() > min(limit, self.hard_limit)
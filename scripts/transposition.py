@@ -0,0 +1,184 @@
+from array import array
+
+EMPTY = 0
+EXACT = 1
+LOWER_BOUND = 2
+UPPER_BOUND = 3
+
+ENTRY_BYTES = 16            # two 64 bit words per entry: checked key and data
+BUCKET_SIZE = 2             # slot 0 is depth-preferred, slot 1 is always-replace
+
+# Data word layout
+MOVE_BITS = 16
+MOVE_MASK = (1 << MOVE_BITS) - 1
+DEPTH_SHIFT = 16
+BOUND_SHIFT = 24
+GENERATION_SHIFT = 26
+GENERATION_MASK = 0x3F
+SCORE_SHIFT = 32
+SCORE_OFFSET = 1 << 31
+SCORE_MAX = (1 << 31) - 2   # keep the two extreme values for -inf and inf
+
+INF = float('inf')
+
+def encode_score(score: int) -> int:
+    if score == INF:
+        return (1 << 32) - 1
+    if score == -INF:
+        return 0
+    return max(-SCORE_MAX, min(SCORE_MAX, int(score))) + SCORE_OFFSET
+
+def decode_score(encoded: int) -> int:
+    if encoded == (1 << 32) - 1:
+        return INF
+    if encoded == 0:
+        return -INF
+    return encoded - SCORE_OFFSET
+
+def table_buckets(size_mb: float) -> int:
+    num_buckets = max(1, int(size_mb * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SIZE))
+    return 1 << (num_buckets.bit_length() - 1)     # Round down to a power of two so the index is a mask
+
+def table_bytes(size_mb: float) -> int:
+    '''
+    Number of bytes used by a table of the given size, to allocate a shared buffer for it.
+    '''
+    return table_buckets(size_mb) * BUCKET_SIZE * ENTRY_BYTES
+
+class TranspositionTable:
+    '''
+    Fixed size transposition table stored in a flat array of 64 bit words.
+
+    Each entry is two words: the data word (score, depth, bound, generation and
+    best move) and the key XOR the data word, so a probe can verify the key and
+    detect a torn entry with a single comparison. Entries are grouped in buckets
+    of two: the first slot keeps the deepest result of the current search, the
+    second one always takes the newest result.
+
+    The table can live in a caller provided buffer (e.g. multiprocessing shared
+    memory of at least table_bytes(size_mb) bytes) to be shared between processes.
+    Concurrent writers can tear an entry, the key check then rejects it.
+    '''
+    def __init__(self, size_mb: float = 16, buffer = None):
+        num_buckets = table_buckets(size_mb)
+        self.num_buckets = num_buckets
+        self.index_mask = num_buckets - 1
+        self.buffer = buffer
+        if buffer is None:
+            self.table = array('Q', bytes(num_buckets * BUCKET_SIZE * ENTRY_BYTES))
+        else:
+            self.table = memoryview(buffer).cast('B')[:table_bytes(size_mb)].cast('Q')
+        self.generation = 0
+
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.table) * self.table.itemsize
+
+    def clear(self) -> None:
+        if self.buffer is None:
+            self.table = array('Q', bytes(self.size_bytes))
+        else:
+            self.table.cast('B')[:] = bytes(self.size_bytes)
+        self.generation = 0
+        self.reset_stats()
+
+    def release(self) -> None:
+        '''
+        Release the view on a caller provided buffer so the buffer can be closed.
+        '''
+        if self.buffer is not None:
+            self.table.release()
+            self.buffer = None
+            self.table = array('Q')
+
+    def new_search(self) -> None:
+        '''
+        Age the table: entries from older searches can be replaced by shallower ones.
+        '''
+        self.generation = (self.generation + 1) & GENERATION_MASK
+
+    def reset_stats(self) -> None:
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def probe(self, key: int) -> tuple[int, int, int, int] | None:
+        '''
+        Look up a position.
+
+        Parameters:
+            key (int): The 64 bit Zobrist hash of the position.
+
+        Returns:
+            tuple[int, int, int, int] | None: (depth, bound, score, packed best move, 0 if none)
+            or None if the position is not in the table.
+        '''
+        self.probes += 1
+        table = self.table
+        index = (key & self.index_mask) * (BUCKET_SIZE * 2)
+        occupied = False
+        for slot in range(index, index + BUCKET_SIZE * 2, 2):
+            data = table[slot + 1]
+            if data == 0:
+                continue
+            if table[slot] ^ data == key:
+                self.hits += 1
+                return (data >> DEPTH_SHIFT) & 0xFF, (data >> BOUND_SHIFT) & 0x3, decode_score(data >> SCORE_SHIFT), data & MOVE_MASK
+            occupied = True
+        if occupied:
+            self.collisions += 1
+        return None
+
+    def store(self, key: int, depth: int, bound: int, score: int, move: int = 0) -> None:
+        self.stores += 1
+        table = self.table
+        index = (key & self.index_mask) * (BUCKET_SIZE * 2)
+        generation = self.generation
+
+        data = (encode_score(score) << SCORE_SHIFT) | (generation << GENERATION_SHIFT) | (bound << BOUND_SHIFT) | (max(0, min(depth, 0xFF)) << DEPTH_SHIFT) | (move & MOVE_MASK)
+
+        deep_data = table[index + 1]
+        deep_key = table[index] ^ deep_data
+        if deep_data == 0 or deep_key == key or depth >= (deep_data >> DEPTH_SHIFT) & 0xFF or (deep_data >> GENERATION_SHIFT) & GENERATION_MASK != generation:
+            if deep_key == key:
+                if move == 0:
+                    data |= deep_data & MOVE_MASK       # Keep the best move of the same position
+            elif deep_data != 0:
+                table[index + 2] = table[index]         # The replaced entry gets a second chance in the always-replace slot
+                table[index + 3] = deep_data
+            slot = index
+        else:
+            recent_data = table[index + 3]
+            if move == 0 and table[index + 2] ^ recent_data == key:
+                data |= recent_data & MOVE_MASK
+            slot = index + 2
+
+        table[slot] = key ^ data
+        table[slot + 1] = data
+
+    def fill_rate(self, sample_buckets: int = 1000) -> float:
+        '''
+        Fraction of used slots in the first sample_buckets buckets.
+        '''
+        sample = min(sample_buckets, self.num_buckets) * BUCKET_SIZE
+        used = sum(1 for slot in range(sample) if self.table[slot * 2 + 1] != 0)
+        return used / sample
+
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "probes": self.probes,
+            "hits": self.hits,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "hit_rate": self.hit_rate(),
+            "fill_rate": self.fill_rate(),
+        }
@@ -1,147 +1,522 @@
+import argparse
+import asyncio
+import secrets
 import socket
-import threading
 import re
 
-from struct import pack, unpack, error
-
 from scripts.board import Board
-from scripts.constants import PORT, END_CONNECTION, MESSAGE_LENGTH, ENCODER, BLACK, WHITE
+from scripts.gamelog import GameLog
+from scripts.matchmaking import Matchmaker
+from scripts.protocol import Message, OP_MOVE, BINARY_FLAG, encode_text, encode_move, encode_snapshot, read_message
+from scripts.constants import PORT, END_CONNECTION, BLACK, WHITE, DEBUG, RECONNECT_GRACE
 SERVER = socket.gethostbyname(socket.gethostname())
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+MAX_CONNECTIONS = 10_000
+MAX_MESSAGE_SIZE = 1024     # Longer messages are a protocol error, the connection is closed
+INBOX_SIZE = 16             # Messages waiting for a game task, a full inbox stops reading from the player
+GAME_LOG_DIR = "games"      # Games are logged there and rebuilt when the server restarts
+SIZES = (9, 11)
+SPECTATOR_BUFFER = 64 * 1024   # Bytes a spectator can be behind before it is dropped
+
+INFO_PATTERN = re.compile(r"info (\d{1,2}) ([a-zA-Z0-9_]{1,16})((?: \S+)*)")
+
+# Messages the server puts in the inbox of a table itself, they are never sent on the wire
+OP_RESUME = -1          # payload: (number of moves the player has, binary)
+OP_GRACE_OVER = -2      # payload: None
+
+InboxItem = tuple[int, asyncio.StreamWriter, Message]      # (color, connection of the player, message)
+
+class Broadcast:
+    '''
+    The spectators of a game and the frames waiting for them.
+
+    The table adds the frames of every move to the buffer, encoded once per protocol, and a
+    single task writes them to all the spectators once the table task lets go of the loop,
+    so the players get their frames first. The write buffer of each connection is the queue
+    of that spectator: nothing waits for it to drain, and a spectator more than
+    SPECTATOR_BUFFER bytes behind is dropped, so a slow one cannot stall the game or the
+    other spectators.
+    '''
+    def __init__(self):
+        self.spectators: dict[asyncio.StreamWriter, bool] = {}     # Connection -> binary
+        self.frames: list[list[bytes]] = [[], []]     # Frames not written yet, text and binary
+        self.pending = asyncio.Event()
+        self.task: asyncio.Task = None
+
+    def add(self, conn: asyncio.StreamWriter, binary: bool, frames: bytes) -> None:
+        '''
+        Add a spectator. The frames, a snapshot of the game, already contain the moves in the buffer.
+        '''
+        self.flush()
+        conn.write(frames)
+        self.spectators[conn] = binary
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def remove(self, conn: asyncio.StreamWriter) -> None:
+        if self.spectators.pop(conn, None) is not None:
+            conn.close()
+
+    def publish(self, text_frames: bytes, binary_frames: bytes) -> None:
+        if self.spectators:
+            self.frames[0].append(text_frames)
+            self.frames[1].append(binary_frames)
+            self.pending.set()
+
+    def flush(self) -> None:
+        if not self.frames[0]:
+            return
+        frames = [b"".join(self.frames[0]), b"".join(self.frames[1])]
+        self.frames = [[], []]
+        slow = []
+        for conn, binary in self.spectators.items():
+            if conn.is_closing() or conn.transport.get_write_buffer_size() > SPECTATOR_BUFFER:
+                slow.append(conn)
+            else:
+                conn.write(frames[binary])
+        for conn in slow:
+            print(f"[{conn.get_extra_info('peername')}] Spectator too slow, dropped")
+            self.remove(conn)
+
+    async def run(self) -> None:
+        while True:
+            await self.pending.wait()
+            self.pending.clear()
+            self.flush()
+
+    def close(self) -> None:
+        self.flush()
+        for conn in self.spectators:
+            conn.close()
+        self.spectators.clear()
+        if self.task is not None:
+            self.task.cancel()
+
+class Table:
+    '''
+    A game between two connections. Messages of both players go through the inbox and are
+    handled one at a time by the task of the table, which owns the board.
+
+    A player whose connection drops is parked: the game waits RECONNECT_GRACE seconds for
+    them to come back with the session token they got with their color, and then they lose.
+    If the opponent is parked too, the game goes on waiting for them: it is abandoned once
+    both grace times are over, and an opponent who comes back in time wins it.
 
-try:
-    sock.bind((SERVER, PORT))
-except socket.error as e:
-    print(str(e))
+    Spectators get a snapshot of the position when they start watching and then every
+    move. A move goes in the broadcast buffer as soon as it is played, before any await,
+    so the snapshot of a new spectator never misses or repeats a move.
+    '''
+    def __init__(self, board_id: int, board: Board) -> None:
+        self.board_id = board_id
+        self.board = board
+        self.conns: list[asyncio.StreamWriter] = [None, None]     # Indexed by color
+        self.binary = [False, False]                               # Whether each player negotiated the binary protocol
+        self.inbox: asyncio.Queue[InboxItem] = asyncio.Queue(INBOX_SIZE)
+        self.task: asyncio.Task = None
+        self.finished = False
+        self.game_id: int = None    # Id of the game in the game log, once both players are in
+        self.tokens: list[str] = [None, None]     # Session tokens, indexed by color
+        self.grace_timers: list[asyncio.TimerHandle] = [None, None]
+        self.gone = [False, False]      # Whether the grace time of each player ran out
+        self.broadcast = Broadcast()
+
+    def watch(self, conn: asyncio.StreamWriter, binary: bool) -> None:
+        board = self.board
+        snapshot = encode_snapshot(board.width, board.turn, len(board.list_of_moves), board.player1, board.player2, board.board)
+        self.broadcast.add(conn, binary, encode_text(snapshot))
+
+    def broadcast_text(self, msg: str) -> None:
+        self.broadcast.publish(encode_text(msg), encode_text(msg, True))
+
+    def new_session(self, color: int) -> str:
+        token = secrets.token_hex(8)
+        self.tokens[color] = token
+        sessions[token] = (self, color)
+        return token
+
+    def park(self, color: int) -> None:
+        '''
+        Drop the connection of a player and give them RECONNECT_GRACE seconds to resume.
+        '''
+        if self.conns[color] is not None:
+            self.conns[color].close()
+            self.conns[color] = None
+        loop = asyncio.get_running_loop()
+        self.grace_timers[color] = loop.call_later(RECONNECT_GRACE, self.grace_over, color)
+
+    def grace_over(self, color: int) -> None:
+        asyncio.create_task(self.inbox.put((color, None, (OP_GRACE_OVER, None))))
+
+    async def resume(self, color: int, conn: asyncio.StreamWriter, ply: int, binary: bool) -> None:
+        '''
+        Attach a new connection of a player and send them the moves played since the
+        ply-th move, which is the number of moves they have.
+        '''
+        board = self.board
+        if ply > len(board.list_of_moves):
+            await send(conn, encode_text("resume failed"))
+            conn.close()
+            return
+
+        parked = self.conns[color] is None
+        if not parked:
+            self.conns[color].close()      # The old connection is dead but the server did not notice yet
+        if self.grace_timers[color] is not None:
+            self.grace_timers[color].cancel()
+            self.grace_timers[color] = None
+        self.conns[color] = conn
+        self.binary[color] = binary
+
+        missed = board.list_of_moves[ply:]
+        frames = encode_text(f"resync {color} {len(missed)} {BINARY_FLAG}" if binary else f"resync {color} {len(missed)}")
+        for move in missed:
+            frames += encode_move((move.from_row, move.from_col, move.to_row, move.to_col), board.width, binary)
+        await send(conn, frames)
+        print(f"[{self.board_id}] Player {color} resumed at move {ply}, {len(missed)} moves missed")
+        if parked:
+            await self.send_text(1 - color, "opponent reconnected")
+
+    async def send_text(self, color: int, msg: str) -> None:
+        if self.conns[color] is not None:
+            await send(self.conns[color], encode_text(msg, self.binary[color]))
+
+    async def send_both(self, msg: str) -> None:
+        for color, conn in enumerate(self.conns):
+            if conn is not None:
+                await send(conn, encode_text(msg, self.binary[color]))
+
+    async def send_move(self, move: tuple[int, int, int, int]) -> None:
+        for color, conn in enumerate(self.conns):
+            if conn is not None:
+                await send(conn, encode_move(move, self.board.width, self.binary[color]))
+
+    async def run(self) -> None:
+        board = self.board
+        cancelled = False
+        try:
+            while True:
+                color, conn, msg = await self.inbox.get()
+                if DEBUG:
+                    print(f"[{self.board_id}] {color}: {msg}")
+
+                if msg is not None and msg[0] == OP_RESUME:
+                    if self.gone[color]:
+                        await send(conn, encode_text("resume failed"))
+                        conn.close()
+                        continue
+                    await self.resume(color, conn, *msg[1])
+                    if self.gone[1 - color]:
+                        board.winner = color    # The opponent ran out of time while this player was away
+                        await self.send_text(color, "win")
+                        break
+                    continue
+                if msg is not None and msg[0] == OP_GRACE_OVER:
+                    if self.conns[color] is not None:
+                        continue    # The player came back in time
+                    print(f"[{self.board_id}] Player {color} did not come back")
+                    self.gone[color] = True
+                    self.grace_timers[color] = None
+                    sessions.pop(self.tokens[color], None)
+                    if self.conns[1 - color] is not None:
+                        board.winner = 1 - color
+                        await self.send_text(1 - color, "win")
+                        break
+                    if self.gone[1 - color]:
+                        break       # Without any player left the game is abandoned
+                    continue        # The opponent may still come back and win
+                if conn is not self.conns[color]:
+                    continue    # Left over from a connection replaced by a resume
+
+                if msg is None and board.ready and board.winner is None and self.tokens[color] is not None:
+                    print(f"[{conn.get_extra_info('peername')}] Connection lost, waiting {RECONNECT_GRACE}s for the player to resume")
+                    self.park(color)
+                    await self.send_text(1 - color, "opponent disconnected")
+                    continue
+                if msg is None or msg[1] == END_CONNECTION:
+                    if msg is not None:
+                        await self.send_text(color, END_CONNECTION)
+                    print(f"[{conn.get_extra_info('peername')}] Closing connection...")
+                    if board.ready and board.winner is None:
+                        board.winner = 1 - color    # Set the winner to the other player
+                        await self.send_text(1 - color, "win")   # Send win to the other player
+                    break
 
-sock.listen()
-print("[STARTING] Server is starting...")
+                opcode, payload = msg
+                if opcode == OP_MOVE:
+                    start_row, start_col, row, col = payload
+                    if board.ready and color == board.turn and board.move_piece(board.get_piece(start_row, start_col), row, col):
+                        if self.game_id is not None:
+                            game_log.log_move(self.game_id, len(board.list_of_moves) - 1, start_row * board.width + start_col, row * board.width + col)
+                        if self.broadcast.spectators:
+                            self.broadcast.publish(encode_move(payload, board.width), encode_move(payload, board.width, True))
+                        await self.send_move(payload)
+                        if DEBUG:
+                            print(board)
+                        if board.winner is not None:
+                            break
+                    else:
+                        await self.send_text(color, "invalid move")
+                        if DEBUG:
+                            print(f"[{self.board_id}] Invalid move")
+                elif payload == "size":
+                    await self.send_text(color, f"size {board.width} {board.height}")
+                else:
+                    await self.send_text(color, "invalid command")
+        except asyncio.CancelledError:
+            cancelled = True    # The server shuts down, the game stays open in the log to be restored
+            raise
+        finally:
+            self.finished = True
+            if self.game_id is not None and not cancelled:
+                game_log.end_game(self.game_id, board.winner)
+            self.broadcast_text(f"end {'none' if board.winner is None else int(board.winner)}")
+            self.broadcast.close()
+            while not self.inbox.empty():   # Wake up the readers blocked on a full inbox
+                _, conn, _ = self.inbox.get_nowait()
+                if conn is not None:
+                    conn.close()    # A resume that came too late
+            for conn in self.conns:
+                if conn is not None:
+                    conn.close()
+            for timer in self.grace_timers:
+                if timer is not None:
+                    timer.cancel()
+            for token in self.tokens:
+                sessions.pop(token, None)
+            matchmaker.remove(self)
 
 connections = 0
-boards_9x9: dict[int, dict[str, Board|socket.socket]] = {0: {"board": Board(9, 9), "player1_conn": None, "player0_conn": None}}    # {board_id: {"board": Board, "player1_conn": socket, "player2_conn": socket}}
-boards_11x11: dict[int, dict[str, Board|socket.socket]] = {0: {"board": Board(11, 11), "player1_conn": None, "player0_conn": None}}    # {board_id: {"board": Board, "player1_conn": socket, "player2_conn": socket}}
+max_connections = MAX_CONNECTIONS
+matchmaker = Matchmaker(lambda board_id, size: Table(board_id, Board(size, size)))
 
-boards = {9: boards_9x9, 11: boards_11x11}
+game_log: GameLog = None
+sessions: dict[str, tuple[Table, int]] = {}     # Session token -> (table, color) of the players in a game
 
-def send(conn: socket.socket, msg: str) -> None:
+async def send(conn: asyncio.StreamWriter, frames: bytes) -> None:
+    '''
+    Send encoded frames with a single write. Waiting for the write buffer to drain slows
+    the sender down to the pace of the receiver.
+    '''
+    if conn.is_closing():
+        return
     try:
-        msg_len = len(msg)
-        send_len = pack('!I', msg_len)
-        conn.send(send_len)
-        conn.send(msg.encode(ENCODER))
-    except socket.error as e:
-        print(f"Send error [{conn.getpeername()}]: {e}")
-
-def recv(conn: socket.socket) -> str:
-    try:
-        msg_len = unpack('!I', conn.recv(MESSAGE_LENGTH))[0]
-        return conn.recv(msg_len).decode()
+        conn.write(frames)
+        await conn.drain()
     except ConnectionError as e:
-        print("Conn closed")
-        raise e
-    except socket.error as e:
-        print(f'Recv error [{conn.getpeername()}]: {e}')
-    except error as e:
-        print(f'Unpacking error [{conn.getpeername()}]: {e}')
-
-def handle_client(conn: socket.socket, addr: tuple, board_id: int, size: int, player_name: str):
-    global connections, boards
+        print(f"Send error [{conn.get_extra_info('peername')}]: {e}")
+
+def parse_info(msg: str) -> tuple[int, str, dict[str, str], bool] | None:
+    '''
+    Read an "info <size> <name> [binary] [rating <n>] [opponent <name>]" message.
+
+    Returns:
+        tuple[int, str, dict[str, str], bool] | None: (size, name, options, binary), or None if the message is not valid.
+    '''
+    match = INFO_PATTERN.fullmatch(msg)
+    if match is None or int(match.group(1)) not in SIZES:
+        return None
+    words = match.group(3).split()
+    binary = BINARY_FLAG in words
+    options = {}
+    for i, word in enumerate(words[:-1]):
+        if word in ("rating", "opponent"):
+            options[word] = words[i + 1]
+    if "rating" in options and not options["rating"].isdigit() or "opponent" in options and re.fullmatch(r"[a-zA-Z0-9_]{1,16}", options["opponent"]) is None:
+        return None
+    return int(match.group(1)), match.group(2), options, binary
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    global connections
+    addr = writer.get_extra_info('peername')
+    if connections >= max_connections:
+        print(f"[REFUSED] {addr}: connection limit reached")
+        await send(writer, encode_text("server full"))
+        writer.close()
+        return
+
     connections += 1
     print(f"[NEW CONNECTION] {addr} connected.")
+    table = None
+    try:
+        info = await read_message(reader, False, 0, MAX_MESSAGE_SIZE)
+        if info is not None and info[1].startswith("resume "):
+            table, color, binary = await resume_session(info[1], writer)
+            if table is None:
+                return
+            await read_player(reader, writer, table, color, binary)
+            return
+        if info is not None and info[1].startswith("watch "):
+            table = await watch_game(reader, writer, info[1])
+            return
+        info = parse_info(info[1]) if info is not None else None
+        if info is None:
+            print("Error: info")
+            return
+        size, player_name, options, binary = info
 
-    board = boards[size][board_id]["board"]
-    conns = boards[size][board_id]
-
-    if connections % 2 == 0:
-        currentId = WHITE
-        conns["player0_conn"] = conn
-        board.player2 = player_name
-    else:
-        currentId = BLACK
-        conns["player1_conn"] = conn
-        board.player1 = player_name
-    
-    send(conn, f"color {currentId}")
-
-    if currentId == WHITE:
-        board.ready = True
-        send(conns["player0_conn"], f"start {board.player1} {board.player2}")
-        send(conns["player1_conn"], f"start {board.player1} {board.player2}")
+        rating = options.get("rating")
+        table, paired = matchmaker.find_table(size, player_name, None if rating is None else int(rating), options.get("opponent"))
+        board = table.board
+        print(f"[{addr}] {'Paired at' if paired else 'Waiting at'} board {table.board_id}")
 
-    while True:
-        msg = recv(conn)
-        print(f"[{addr}] {msg}")
+        if paired:
+            color = WHITE
+            board.player2 = player_name
+        else:
+            color = BLACK
+            board.player1 = player_name
+        table.conns[color] = writer
+        table.binary[color] = binary
 
-        if msg is None:
-            break
+        # The color message is the last one in text, the start message goes out in the same write
+        token = table.new_session(color)
+        frames = encode_text(f"color {color} {BINARY_FLAG} session {token}" if binary else f"color {color} session {token}")
+        if color == WHITE:
+            board.ready = True
+            if game_log is not None:
+                table.game_id = game_log.start_game(size, [board.player2, board.player1], table.tokens)
+            start_msg = f"start {board.player1} {board.player2}"
+            table.broadcast_text(start_msg)
+            await send(table.conns[BLACK], encode_text(start_msg, table.binary[BLACK]))
+            frames += encode_text(start_msg, binary)
+        await send(writer, frames)
+        if table.task is None:
+            table.task = asyncio.create_task(table.run())
+
+        await read_player(reader, writer, table, color, binary)
+    finally:
+        connections -= 1
+        if table is None:
+            writer.close()      # Otherwise the table closes it after the last message to this player
+        print(f"[ACTIVE CONNECTIONS] {connections}")
 
-        if msg == END_CONNECTION:
-            send(conn, END_CONNECTION)
-            print(f"[{addr}] Closing connection...")
-            if board.ready and board.winner is None:
-                board.winner = 1 - currentId    # Set the winner to the other player
-                send(conns[f"player{1-currentId}_conn"], "win")   # Send win to the other player
+async def read_player(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, table: Table, color: int, binary: bool) -> None:
+    '''
+    Pass the messages of a player to their table until the connection or the game ends.
+    '''
+    while not table.finished:
+        msg = await read_message(reader, binary, table.board.width, MAX_MESSAGE_SIZE)
+        if table.finished:
             break
-        elif re.match(r"move [\d]{1,2} [\d]{1,2} [\d]{1,2} [\d]{1,2}", msg) is not None:
-            start_row, start_col, row, col = map(int, msg.split()[1:])
-            if board.move_piece(board.get_piece(start_row, start_col), row, col):
-                send(conns["player0_conn"], f"move {start_row} {start_col} {row} {col}")
-                send(conns["player1_conn"], f"move {start_row} {start_col} {row} {col}")
-                print(board)
-                if board.winner is not None:
-                    break
-            else:
-                send(conn, "invalid move")
-                print(f"[{addr}] Invalid move")
-        elif msg == "size":
-            send(conn, f"size {board.width} {board.height}")
-        else:
-            send(conn, "invalid command")
+        await table.inbox.put((color, writer, msg))     # Waits while the game is behind, which stops reading from this player
+        if msg is None or msg[1] == END_CONNECTION:
+            break
+
+async def watch_game(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, msg: str) -> Table | None:
+    '''
+    Send a game to a spectator, from a "watch <board id> [binary]" message, until the game
+    or the connection ends.
 
-    connections -= 1
+    Returns:
+        Table | None: The table watched, None if there is no such game.
+    '''
+    match = re.fullmatch(r"watch (\d{1,9})( " + BINARY_FLAG + ")?", msg)
+    table = matchmaker.tables.get(int(match.group(1))) if match is not None else None
+    if table is None or table.finished:
+        await send(writer, encode_text("watch failed"))
+        return None
+
+    binary = match.group(2) is not None
+    table.watch(writer, binary)
+    print(f"[{writer.get_extra_info('peername')}] Watching board {table.board_id}, {len(table.broadcast.spectators)} spectators")
     try:
-        del boards[size][board_id]
-    except:
-        pass
-    print(f"[ACTIVE CONNECTIONS] {connections}")
-    conn.close()
-
-def start():
-    while True:
-        if connections < 6:
-            print("[WAITING FOR CONNECTIONS] Waiting for connections...")
-            conn, addr = sock.accept()
-
-            info = recv(conn)
-            if info is None or re.match(r"info [\d]{1,2} [a-zA-Z0-9_]{1,16}", info) is None:
-                print("Error: info")
-                conn.close()
-                continue
-            print(f"Size received: {info}")
-            size = int(info.split(" ")[1])
-            player_name = str(info.split(" ")[2])
-
-            board_id = -1
-            for id in boards[size]:
-                if boards[size][id]["board"].ready == False:
-                    print(f"[{addr}] Found board {id}")
-                    board_id = id
-                    break
-            
-            if board_id == -1:
-                try:
-                    board_id = list(boards[size].keys())[-1] + 1
-                    boards[size][board_id] = {"board": Board(9, 9), "player1_conn": None, "player2_conn": None}
-                except:
-                    board_id = 0
-                    boards[size][board_id] = {"board": Board(9, 9), "player1_conn": None, "player2_conn": None}
-
-            thread = threading.Thread(target=handle_client, args=(conn, addr, board_id, size, player_name))
-            thread.start()
-            print(f"[ACTIVE CONNECTIONS] {connections}")
-
-    print("[SHUTTING DOWN] Server is shutting down...")
-    sock.close()
-
-start()
\ No newline at end of file
+        while not table.finished:   # Spectators only talk to leave
+            msg = await read_message(reader, binary, table.board.width, MAX_MESSAGE_SIZE)
+            if msg is None or msg[1] == END_CONNECTION:
+                break
+    finally:
+        table.broadcast.remove(writer)
+    return table
+
+async def resume_session(msg: str, writer: asyncio.StreamWriter) -> tuple[Table | None, int, bool]:
+    '''
+    Hand a new connection to the game of a session, from a "resume <token> <moves> [binary]" message.
+
+    Returns:
+        tuple[Table | None, int, bool]: (table, color, binary) of the session, table is None if it cannot be resumed.
+    '''
+    match = re.fullmatch(r"resume ([0-9a-f]{16}) (\d{1,4})( " + BINARY_FLAG + ")?", msg)
+    session = sessions.get(match.group(1)) if match is not None else None
+    if session is None or session[0].finished:
+        print(f"[{writer.get_extra_info('peername')}] Resume failed")
+        await send(writer, encode_text("resume failed"))
+        return None, 0, False
+
+    table, color = session
+    binary = match.group(3) is not None
+    await table.inbox.put((color, writer, (OP_RESUME, (int(match.group(2)), binary))))
+    return table, color, binary
+
+def restore_games(log: GameLog) -> int:
+    '''
+    Rebuild the tables of the games of the log that were not over. Both players are parked
+    until they resume their session, games without one are abandoned after the grace time.
+
+    Returns:
+        int: The number of games restored.
+    '''
+    restored = 0
+    for game in log.open():
+        if game.size not in SIZES:
+            continue
+        board = Board(game.size, game.size)
+        board.player2, board.player1 = game.players
+        for from_sq, to_sq in game.moves:
+            if not board.move_piece(board.get_piece(*divmod(from_sq, game.size)), *divmod(to_sq, game.size)):
+                print(f"[RESTORE] Game {game.game_id}: invalid move {from_sq} -> {to_sq}, replay stopped")
+                break
+        if board.winner is not None:
+            log.end_game(game.game_id, board.winner)
+            continue
+        board.ready = True
+
+        table = Table(matchmaker.new_id(), board)
+        table.game_id = game.game_id
+        for color, token in enumerate(game.tokens):
+            if token is not None:
+                table.tokens[color] = token
+                sessions[token] = (table, color)
+            table.park(color)
+        table.task = asyncio.create_task(table.run())
+        matchmaker.add(table)
+        restored += 1
+    return restored
+
+async def start(host: str = SERVER, port: int = PORT, log_dir: str = GAME_LOG_DIR) -> None:
+    global game_log
+    flush_task = None
+    if log_dir is not None:
+        game_log = GameLog(log_dir)
+        print(f"[RESTORING] {restore_games(game_log)} games restored from {log_dir}")
+        flush_task = asyncio.create_task(game_log.run())
+
+    server = await asyncio.start_server(handle_client, host, port)
+    print("[STARTING] Server is starting...")
+    print(f"[WAITING FOR CONNECTIONS] Listening on {host}:{port}, up to {max_connections} connections")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # The tables stop before the log closes, their games are not over and get no END record
+        tasks = [table.task for table in matchmaker.tables.values() if table.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if flush_task is not None:
+            flush_task.cancel()
+            game_log.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hnefatafl game server.")
+    parser.add_argument("--host", default=SERVER)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS)
+    parser.add_argument("--log-dir", default=GAME_LOG_DIR, help=f"directory of the game log (default: {GAME_LOG_DIR})")
+    parser.add_argument("--no-log", action="store_true", help="do not log the games, they are lost when the server stops")
+    args = parser.parse_args()
+
+    max_connections = args.max_connections
+    try:
+        asyncio.run(start(args.host, args.port, None if args.no_log else args.log_dir))
+    except KeyboardInterrupt:
+        print("[SHUTTING DOWN] Server is shutting down...")
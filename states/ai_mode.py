@@ -5,13 +5,16 @@ if TYPE_CHECKING:
 
 import pygame
 import threading
+import queue
 import random
+import time
 
-from scripts.bot import Bot
-from scripts.constants import BACKGROUND, RENDER_SCALE, SQUARE_SIZE, SIDE_PANEL, WIDTH, HEIGHT, WHITE, BLACK
+from scripts.bot import Bot, SEARCH_PROCESSES, PONDER, BOT_CLOCK, BOT_INCREMENT
+from scripts.parallel import ParallelBot
+from scripts.constants import BACKGROUND, RENDER_SCALE, SQUARE_SIZE, SIDE_PANEL, WIDTH, HEIGHT, WHITE, BLACK, DEBUG
 from states.state import State
 from scripts.board import VisualBoard
-from scripts.move import Move
+from scripts.move import Move, move_from_packed
 
 class AIMode(State):
     def __init__(self, game: Game, width:int, height:int):
@@ -27,7 +30,12 @@ class AIMode(State):
         self.game.board_display = pygame.Surface((self.width // RENDER_SCALE, self.height // RENDER_SCALE))
 
         self.board = VisualBoard(self.game, width, height)
-        self.bot = Bot(width, random.choice([WHITE, BLACK]))
+        if SEARCH_PROCESSES > 1:
+            self.bot = ParallelBot(width, random.choice([WHITE, BLACK]), SEARCH_PROCESSES)
+        else:
+            self.bot = Bot(width, random.choice([WHITE, BLACK]))
+        self.bot.clock = BOT_CLOCK
+        self.bot.increment = BOT_INCREMENT
         
         if self.bot.color == WHITE:
             self.board.player1 = "Player (Blue)"
@@ -38,24 +46,141 @@ class AIMode(State):
 
         self.bot_start_countdown = 30
 
+        # The bot thread owns the bot and its board. It sleeps on the command queue until
+        # the player moves, takes back moves or the countdown ends, and posts its moves as
+        # BOT_MOVE events tagged with the number of moves of the position they answer.
+        self.BOT_MOVE = pygame.USEREVENT + 2
+        self.commands: queue.Queue[tuple | None] = queue.Queue()
+        self.pending: list[tuple | None] = []
+        self.ponder_reply: Move = None
+        self.ponder_confirmed = False
+        self.ponder_hit_time = 0.0     # When the player played the predicted reply, the clock of the bot runs from there
+
         self.bot_thread = threading.Thread(target=self.bot_play)
         self.bot_thread.start()
 
+    def next_command(self) -> tuple | None:
+        if self.pending:
+            return self.pending.pop(0)
+        return self.commands.get()
+
+    def command_pending(self) -> bool:
+        return bool(self.pending) or not self.commands.empty()
+
     def bot_play(self):
-        while self.board.winner is None:
-            if self.board.turn == self.bot.color and self.bot_start_countdown == 0:
-                move = self.bot.get_move()
-                self.bot.board.move_piece_by_move(move)
-                self.board.move_piece_by_move(move)
+        while True:
+            command = self.next_command()
+            if command is None:
+                break
+            if command[0] == "move":
+                self.bot.board.move_piece_by_move(command[1])
+            elif command[0] == "sync":
+                self.bot.board.reset(self.bot.board.width, self.bot.board.height)
+                for move in command[1]:
+                    self.bot.board.move_piece_by_move(move)
+                if not command[1]:      # Restarted
+                    self.bot.clock = BOT_CLOCK
+            if self.command_pending():
+                continue
+
+            board = self.bot.board
+            if board.winner is not None or board.turn != self.bot.color or self.bot_start_countdown > 0:
+                continue
+
+            self.bot.abort_check = self.command_pending     # Taking back moves or leaving discards the search
+            start = time.monotonic()
+            move = self.bot.get_move(start)
+            self.bot.abort_check = None
+            if move is None or self.command_pending():
+                continue
+            self.bot.use_time(time.monotonic() - start)
+            self.play_bot_move(move)
+            while PONDER and self.ponder():
+                pass
+
+    def play_bot_move(self, move: Move) -> None:
+        ply = len(self.bot.board.list_of_moves)
+        self.bot.board.move_piece_by_move(move)
+        pygame.event.post(pygame.event.Event(self.BOT_MOVE, {"move": move, "ply": ply}))
+
+    def ponder(self) -> bool:
+        '''
+        Search the predicted reply of the player while they think. If they play it, the search
+        goes on as the search of the answer, otherwise the reply is taken back and the
+        commands received meanwhile are left to bot_play.
+
+        Returns:
+            bool: True if the answer was played, the bot can ponder again.
+        '''
+        reply = self.bot.predicted_reply()
+        if not reply or self.command_pending():
+            return False
+        self.ponder_reply = move_from_packed(reply, self.bot.board.width, self.bot.board.height)
+        self.ponder_confirmed = False
+        self.bot.abort_check = self.check_ponder
+        move = self.bot.ponder(reply)
+        self.bot.abort_check = None
+
+        if not self.ponder_confirmed and not self.pending:
+            # The search ended before the player moved, wait for the move
+            self.check_ponder(block=True)
+        if not self.ponder_confirmed:
+            self.bot.board.undo_move()
+            return False
+        if self.pending:
+            return False    # Taken back or left while the answer was searched, a sync or stop follows
+        if move is None or self.bot_start_countdown > 0 or self.bot.board.winner is not None:
+            self.pending.insert(0, ("wake",))   # Let bot_play decide what to do in the new position
+            return False
+        self.bot.use_time(time.monotonic() - self.ponder_hit_time)
+        self.play_bot_move(move)
+        return self.bot.board.winner is None
+
+    def check_ponder(self, block: bool = False) -> bool:
+        '''
+        Abort check of the ponder search, run by the search in the bot thread. The predicted
+        reply confirms the search, any other command stops it.
+        '''
+        if self.pending:
+            return True
+        try:
+            command = self.commands.get(block=block)
+        except queue.Empty:
+            return False
+        if command is not None and command[0] == "move" and command[1] == self.ponder_reply and not self.ponder_confirmed:
+            self.ponder_confirmed = True
+            self.ponder_hit_time = time.monotonic()
+            self.bot.ponder_hit()
+            if DEBUG:
+                print(f"Ponder hit: {command[1]}")
+            return False
+        self.pending.append(command)
+        return True
+
+    def stop_bot(self) -> None:
+        self.commands.put(None)
+        self.bot_thread.join()
+        self.bot.close()
+
+    def sync_bot(self) -> None:
+        self.commands.put(("sync", list(self.board.list_of_moves)))
 
     def update(self):
-        self.bot_start_countdown = max(0, self.bot_start_countdown - 1)
+        if self.bot_start_countdown > 0:
+            self.bot_start_countdown -= 1
+            if self.bot_start_countdown == 0:
+                self.commands.put(("wake",))
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.game.running = False
                 self.board.winner = 3
-                self.bot_thread.join()
+                self.stop_bot()
+
+            if event.type == self.BOT_MOVE:
+                # Moves computed before a take back or a restart are stale
+                if event.ply == len(self.board.list_of_moves) and self.board.turn == self.bot.color and self.board.winner is None:
+                    self.board.move_piece_by_move(event.move)
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
@@ -64,13 +189,13 @@ class AIMode(State):
                     self.game.screen = pygame.display.set_mode((WIDTH + SIDE_PANEL, HEIGHT))
                     self.game.board_display = pygame.Surface((WIDTH // RENDER_SCALE, HEIGHT // RENDER_SCALE))
                     self.board.winner = 3
-                    self.bot_thread.join()
+                    self.stop_bot()
                     print("AIMode -> LocalMode")
 
                 if event.key == pygame.K_r:
-                    self.bot.board.reset(9, 9)
-                    self.board.reset(9, 9)
+                    self.board.reset(self.board.width, self.board.height)
                     self.board.deselect_piece()
+                    self.sync_bot()
 
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
@@ -85,15 +210,15 @@ class AIMode(State):
                     elif piece is None and self.board.selected_piece is not None:
                         if self.board.turn != self.bot.color:
                             move = Move(self.board.selected_piece.row, self.board.selected_piece.col, row, col, self.board.height)
-                            self.bot.board.move_piece_by_move(move)
-                            self.board.move_piece_by_move(move)
+                            if self.board.move_piece_by_move(move):
+                                self.commands.put(("move", move))
                         self.board.deselect_piece()
 
                 if event.button == 3:
                     self.board.deselect_piece()
                     self.bot_start_countdown = 90
-                    self.bot.board.undo_move()
                     self.board.undo_move()
+                    self.sync_bot()
 
                 if event.button == 4:
                     self.board.scroll = min(0, self.board.scroll + 16)
@@ -5,39 +5,34 @@ if TYPE_CHECKING:
 
 import socket
 import threading
+import time
 import pygame
 import re
 
-from struct import pack, unpack, error
-
 from states.state import State
 from scripts.board import VisualBoard
-from scripts.constants import BACKGROUND, SERVER, PORT, END_CONNECTION, MESSAGE_LENGTH, ENCODER, BLACK, SIDE_PANEL, WIDTH, HEIGHT, RENDER_SCALE, SQUARE_SIZE
+from scripts.protocol import Message, OP_MOVE, BINARY_FLAG, encode_text, encode_move, recv_message
+from scripts.constants import BACKGROUND, SERVER, PORT, END_CONNECTION, BLACK, SIDE_PANEL, WIDTH, HEIGHT, RENDER_SCALE, SQUARE_SIZE, RECONNECT_GRACE, RECONNECT_DELAY
 
-def send(conn: socket.socket, msg: str) -> None:
+def send(conn: socket.socket, frames: bytes) -> None:
     try:
-        msg_len = len(msg)
-        send_len = pack('!I', msg_len)
-        conn.send(send_len)
-        conn.send(msg.encode(ENCODER))
+        conn.sendall(frames)
     except socket.error as e:
         print(f"Send error: {e}")
 
-def recv(conn:socket.socket) -> str:
+def recv(conn: socket.socket, binary: bool = False, size: int = 0) -> Message:
     try:
-        msg_len = unpack('!I', conn.recv(MESSAGE_LENGTH))[0]
-        return conn.recv(msg_len).decode()
+        return recv_message(conn, binary, size)
     except socket.error as e:
         print(f'Recv error: {e}')
-    except error as e:
-        print(f'Unpacking error: {e}')
 
 class Client(State):
     def __init__(self, game: Game, size: int, name: str):
         State.__init__(self, game)
-        self.msg = ""
+        self.msg = b""     # Encoded frames waiting to be sent
         self.msg_to_send = ""
         self.name = name
+        self.binary = False
 
         self.size = size
         self.width = self.size * SQUARE_SIZE * RENDER_SCALE
@@ -49,9 +44,13 @@ class Client(State):
         self.board = VisualBoard(self.game, self.size, self.size)
 
         self.opp_disconnect = False
+        self.opp_away = False       # The connection of the opponent dropped, the server waits for them
+        self.reconnecting = False
 
         self.sock = None
         self.connected = False
+        self.closing = False
+        self.token: str = None      # Session token, to resume the game if the connection drops
         self.CONNECTION_REFUSED = pygame.USEREVENT + 1
 
         self.thread = threading.Thread(target=self.main_connect)
@@ -68,32 +67,39 @@ class Client(State):
         print("[CONNECTED] Connected to server")
         self.connected = True
 
-        send(self.sock, f"info {self.size} {self.name}")    # Send the size of the board and the name of the player
+        send(self.sock, encode_text(f"info {self.size} {self.name} {BINARY_FLAG}"))    # Send the size of the board and the name of the player, and ask for the binary protocol
         
         color = recv(self.sock)
-        if color is None or re.match(r"color \d", color) is None:
+        if color is None or re.match(r"color \d", color[1]) is None:
             print("Error: color")
             return
-        print(f"Color received: {color}")
-        self.color = int(color.split()[1])
+        print(f"Color received: {color[1]}")
+        color = color[1].split()
+        self.color = int(color[1])
+        self.binary = BINARY_FLAG in color[2:]     # Old servers only speak text
+        if "session" in color[2:-1]:
+            self.token = color[color.index("session") + 1]
 
         while True:
             pygame.time.wait(int(1000 / 30))
-            if self.msg != "":
+            if self.msg != b"":
                 print(f"Sending: {self.msg}")
                 send(self.sock, self.msg)
-                self.msg = ""
+                self.msg = b""
             elif self.board.ready and self.color == self.board.turn:
                 continue
 
             print("Waiting for response...")
-            resp = recv(self.sock)
+            resp = recv(self.sock, self.binary, self.size)
 
             if resp is None:
+                if self.token is not None and self.board.ready and self.board.winner is None and not self.closing and self.reconnect():
+                    continue
                 break
 
-            if re.match(r"move [\d]{1,2} [\d]{1,2} [\d]{1,2} [\d]{1,2}", resp):
-                start_row, start_col, row, col = map(int, resp.split()[1:5])
+            opcode, resp = resp
+            if opcode == OP_MOVE:
+                start_row, start_col, row, col = resp
                 if self.board.move_piece(self.board.get_piece(start_row, start_col), row, col):
                     print("Valid move")
                     print(self.board)
@@ -116,17 +122,70 @@ class Client(State):
                 print(f"Players: {name1} vs {name2}")
                 pygame.mixer.music.fadeout(500)
                 self.game.sounds["start"].play()
+            elif resp == "opponent disconnected":
+                self.opp_away = True
+                print("Opponent disconnected, waiting for them to come back")
+            elif resp == "opponent reconnected":
+                self.opp_away = False
+                print("Opponent reconnected")
             elif resp == END_CONNECTION:
                 print("Closing connection...")
-                send(self.sock, END_CONNECTION)
+                send(self.sock, encode_text(END_CONNECTION, self.binary))
                 break
             else:
                 print(f"Received: {resp}")
 
         self.sock.close()
 
+    def reconnect(self) -> bool:
+        '''
+        Open a new connection after the connection dropped and resume the session. The server
+        sends back the moves played since the last move this client has.
+
+        Returns:
+            bool: True if the game goes on, False if it could not be resumed in time.
+        '''
+        self.reconnecting = True
+        self.sock.close()
+        deadline = time.monotonic() + RECONNECT_GRACE
+        while not self.closing and time.monotonic() < deadline:
+            pygame.time.wait(int(RECONNECT_DELAY * 1000))
+            try:
+                sock = socket.create_connection((SERVER, PORT), timeout=RECONNECT_DELAY)
+                sock.settimeout(None)
+            except socket.error as e:
+                print(f"Reconnect error: {e}")
+                continue
+            self.sock = sock
+
+            msg = f"resume {self.token} {len(self.board.list_of_moves)}"
+            send(sock, encode_text(f"{msg} {BINARY_FLAG}" if self.binary else msg))
+            resync = recv(sock)
+            if resync is None:
+                sock.close()
+                continue
+            if re.match(r"resync \d \d+", resync[1]) is None:
+                print(f"Resume refused: {resync[1]}")
+                break
+            print(f"Resumed: {resync[1]}")
+            resync = resync[1].split()
+            self.binary = BINARY_FLAG in resync[3:]
+            for _ in range(int(resync[2])):
+                resp = recv(sock, self.binary, self.size)
+                if resp is None or resp[0] != OP_MOVE:
+                    break
+                start_row, start_col, row, col = resp[1]
+                self.board.move_piece(self.board.get_piece(start_row, start_col), row, col)
+            else:
+                self.reconnecting = False
+                return self.board.winner is None
+            sock.close()    # Dropped again in the middle of the moves, the next resume asks for the rest
+        self.reconnecting = False
+        return False
+
     def close_state(self):
-        self.msg = END_CONNECTION
+        self.closing = True
+        self.msg = encode_text(END_CONNECTION, self.binary)
         if self.sock is not None and self.connected:
             try:
                 send(self.sock, self.msg)
@@ -168,7 +227,7 @@ class Client(State):
                     elif piece is None and self.board.selected_piece is not None and self.board.selected_piece.color == self.color:   # Only allow moves the player's pieces
                         start_row, start_col = self.board.selected_piece.row, self.board.selected_piece.col
                         if self.sock is not None:
-                            self.msg = f'move {start_row} {start_col} {row} {col}'
+                            self.msg = encode_move((start_row, start_col, row, col), self.size, self.binary)
                         self.board.deselect_piece()
                     else:
                         self.board.deselect_piece()
@@ -196,6 +255,10 @@ class Client(State):
             self.game.draw_text(self.game.screen, self.board.player1, (255, 255, 255), self.game.screen.get_width() - SIDE_PANEL // 2, 70, self.game.font_small)
             self.game.draw_text(self.game.screen, "VS", (255, 255, 255), self.game.screen.get_width() - SIDE_PANEL // 2, 90, self.game.font_small)
             self.game.draw_text(self.game.screen, self.board.player2, (255, 255, 255), self.game.screen.get_width() - SIDE_PANEL // 2, 110, self.game.font_small)
+            if self.reconnecting:
+                self.game.draw_text(self.game.screen, "Reconnecting...", (255, 255, 255), self.game.screen.get_width() - SIDE_PANEL // 2, 160, self.game.font_small)
+            elif self.opp_away:
+                self.game.draw_text(self.game.screen, "Opponent Reconnecting...", (255, 255, 255), self.game.screen.get_width() - SIDE_PANEL // 2, 160, self.game.font_small)
         elif self.opp_disconnect:
             self.game.draw_text(self.game.screen, "Opponent Disconnected", (255, 255, 255), self.game.screen.get_width() - SIDE_PANEL // 2, self.game.screen.get_height() // 2 + 36, self.game.font_small)
 